@@ -0,0 +1,55 @@
+''' Compare two benchmark result files written by bench/run.py:
+
+        python -m bench.compare base.json head.json [--threshold 0.10]
+
+    Prints the change in time for every step, and exits non-zero if any step
+    got slower by more than the threshold (10% by default).
+'''
+import sys
+import json
+import argparse
+
+
+def compare(base, head, threshold=0.10):
+    ''' Per-step (name, base seconds, head seconds, ratio) rows for the steps
+        both runs have, and the names of steps that regressed past threshold
+    '''
+    rows, regressions = [], []
+    for name in sorted(set(base['results']) & set(head['results'])):
+        before = base['results'][name].get('seconds')
+        after = head['results'][name].get('seconds')
+        if not before or after is None:
+            continue
+        ratio = after / before
+        rows.append((name, before, after, ratio))
+        if ratio > 1. + threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two fincore benchmark results')
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed slowdown, as a fraction')
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    for key in ('dialect', 'symbols', 'days', 'seed'):
+        if base.get(key) != head.get(key):
+            print('Warning: Runs Differ In %s (%s vs %s)' % (key, base.get(key), head.get(key)))
+
+    rows, regressions = compare(base, head, threshold=args.threshold)
+    print('%-24s %10s %10s %8s' % ('Step', 'Base', 'Head', 'Change'))
+    for name, before, after, ratio in rows:
+        print('%-24s %9.3fs %9.3fs %+7.1f%%%s' % (
+            name, before, after, (ratio - 1.) * 100., '  <- Regression' if name in regressions else ''
+        ))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
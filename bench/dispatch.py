@@ -0,0 +1,168 @@
+''' Dispatcher Check
+
+    Sends requests through fetch.Dispatcher to a local stand-in for the
+    AlphaVantage query endpoint, and checks that they go out within the token
+    bucket rate limit, that every response is received exactly once and on
+    the calling thread (which owns the session), and that a request the stub
+    never answers times out and is counted as a failure instead of hanging
+    the run. Run from the repository root:
+
+        python -m bench.dispatch --requests 12 --rpm 600 --burst 2 --workers 4
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from bench.live import _Server
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from urlparse import urlsplit, parse_qs
+except ImportError:
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import urlsplit, parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class AlphaVantageStub(object):
+    def __init__(self, delay=0.01, hang=None, port=0):
+        ''' Local stand-in for the AlphaVantage query endpoint, answering each
+            request with a small JSON payload naming its symbol, after `delay`
+            seconds. Requests for the `hang` symbol are held for a minute, to
+            exercise the HTTP timeout. The time each request arrives is kept
+        '''
+        self.delay = delay
+        self.hang = hang
+        self.arrivals = []
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                symbol = parse_qs(urlsplit(self.path).query).get('symbol', [''])[0]
+                with stub._lock:
+                    stub.arrivals.append((time.time(), symbol))
+                time.sleep(60. if symbol == stub.hang else stub.delay)
+                body = json.dumps({'Meta Data': {'2. Symbol': symbol}}).encode('utf-8')
+                try:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except IOError:
+                    # The client gave up on a held request:
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = _Server(('127.0.0.1', port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s' % self.server.server_address[1]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubRequest(object):
+    def __init__(self, id, url, symbol):
+        ''' The parts of an APIRequest the Dispatcher uses, recording the
+            thread each response is received on
+        '''
+        self.id = id
+        self.url = url
+        self.symbol = symbol
+        self.sent = False
+        self.successful = None
+        self.received = []
+
+    def marksent(self):
+        self.sent = True
+
+    def receive(self, result, cutoff=None):
+        if result['Meta Data']['2. Symbol'] != self.symbol:
+            raise Exception('Received The Response For %s On %s' % (result['Meta Data']['2. Symbol'], self))
+        self.received.append(threading.current_thread())
+
+    def __repr__(self):
+        return '<StubRequest %s: %s>' % (self.id, self.symbol)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the Dispatcher against a local AlphaVantage stub')
+    parser.add_argument('--requests', type=int, default=12, help='number of requests to send')
+    parser.add_argument('--rpm', type=float, default=600, help='rate limit, in requests per minute')
+    parser.add_argument('--burst', type=int, default=2, help='rate limit burst')
+    parser.add_argument('--workers', type=int, default=4, help='dispatcher worker threads')
+    parser.add_argument('--timeout', type=float, default=0.5, help='HTTP timeout, in seconds')
+    args = parser.parse_args(argv)
+
+    # Requests are stubbed, but the Dispatcher still commits the shared
+    # session, so point it at a scratch database:
+    os.environ['FINCORE_DB'] = 'sqlite:///%s' % os.path.join(tempfile.mkdtemp(prefix='fincore-dispatch-'), 'dispatch.db')
+    os.environ.pop('FINCORE_REPLAY', None)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    from fetch import Dispatcher
+    from utils import ResponseArchive
+
+    ResponseArchive.shared().timeout = args.timeout
+    symbols = ['SYN%03d' % i for i in range(args.requests)]
+    stub = AlphaVantageStub(hang=symbols[-1])
+    requests = [
+        StubRequest(i, '%s/query?function=TIME_SERIES_INTRADAY&symbol=%s' % (stub.url, symbol), symbol)
+        for i, symbol in enumerate(symbols)
+    ]
+
+    try:
+        start = time.time()
+        dispatcher = Dispatcher(rpm=args.rpm, burst=args.burst, workers=args.workers)
+        stats = dispatcher.send(requests)
+    finally:
+        stub.close()
+
+    # Every request went out once, no sooner than the bucket allowed: the
+    # k-th one (from 0) needs k + 1 - burst tokens refilled after the start:
+    arrivals = sorted(arrival for arrival, symbol in stub.arrivals)
+    assert sorted(symbol for arrival, symbol in stub.arrivals) == symbols, 'Not Every Request Was Sent Once'
+    interval = 60. / args.rpm
+    for k, arrival in enumerate(arrivals):
+        allowed = start + max(k + 1 - args.burst, 0) * interval
+        assert arrival >= allowed - 0.01, 'Request %s Sent %.3fs Early' % (k, allowed - arrival)
+
+    # Every response was received once, on the calling thread, except the
+    # held one, which timed out:
+    caller = threading.current_thread()
+    for request in requests[:-1]:
+        assert request.received == [caller], '%s Received %s Times Off The Calling Thread' % (request, len(request.received))
+    assert not requests[-1].received and requests[-1].successful is False, 'The Held Request Did Not Fail'
+    assert stats['failures'] == 1, '%s Failures, Expected 1' % stats['failures']
+
+    result = {
+        'requests': stats['requests'],
+        'failures': stats['failures'],
+        'seconds': stats['elapsed'],
+        'achieved_rpm': stats['achieved'],
+        'limit_rpm': stats['limit'],
+        'first_to_last_seconds': arrivals[-1] - arrivals[0],
+    }
+    sys.stderr.write('Dispatcher OK: %s Requests In %.2fs At %.0f/min Against A %.0f/min Limit\n' % (
+        stats['requests'], stats['elapsed'], stats['achieved'], stats['limit']
+    ))
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+''' Watchlist Polling Benchmark
+
+    Serves synthetic Tiingo IEX minute bars from a local stub server with a
+    fixed per-request delay, and compares refreshing a watchlist one symbol at
+    a time against TiingoClient.getlive_many. Run from the repository root:
+
+        python -m bench.live --symbols 50 --delay 0.05 --workers 8
+'''
+import sys
+import json
+import time
+import datetime
+import argparse
+import threading
+import numpy as np
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class TiingoStub(object):
+    def __init__(self, delay=0.05, bars=120, port=0):
+        ''' Local stand-in for the Tiingo IEX prices endpoint, answering every
+            symbol with its last `bars` minute bars (up to the current minute)
+            as CSV, after `delay` seconds. Connections are kept alive, and the
+            number opened is counted, so connection reuse can be checked
+        '''
+        self.delay = delay
+        self.bars = bars
+        self.requests = 0
+        self.clients = set()
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                    stub.clients.add(self.client_address)
+                time.sleep(stub.delay)
+                parts = self.path.split('/')
+                if len(parts) < 3 or parts[1] != 'iex':
+                    self.send_error(404)
+                    return
+                body = stub.csv(parts[2]).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = _Server(('127.0.0.1', port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%s' % self.server.server_address[1]
+
+    @property
+    def connections(self):
+        return len(self.clients)
+
+    def csv(self, symbol):
+        ''' Deterministic bars for the symbol, in Tiingo's CSV layout
+        '''
+        random = np.random.RandomState(sum(ord(c) for c in symbol))
+        now = datetime.datetime.now().replace(second=0, microsecond=0)
+        close = 100. * np.exp(np.cumsum(random.normal(0., 5e-4, self.bars)))
+        lines = ['date,open,high,low,close,volume']
+        for i in range(self.bars):
+            timestamp = now - datetime.timedelta(minutes=self.bars - 1 - i)
+            price = close[i]
+            lines.append('%s -05:00,%.4f,%.4f,%.4f,%.4f,%d' % (
+                timestamp.strftime('%Y-%m-%d %H:%M:%S'), price, price * 1.0005, price * 0.9995, price, 1000 + i
+            ))
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv=None):
+    from utils import TiingoClient
+
+    parser = argparse.ArgumentParser(description='Benchmark watchlist polling against a local Tiingo stub')
+    parser.add_argument('--symbols', type=int, default=50, help='watchlist size')
+    parser.add_argument('--delay', type=float, default=0.05, help='stub response delay, in seconds')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent requests for getlive_many')
+    args = parser.parse_args(argv)
+
+    symbols = ['SYN%03d' % i for i in range(args.symbols)]
+    results = {}
+
+    for name, workers in [('serial', 1), ('concurrent', args.workers)]:
+        stub = TiingoStub(delay=args.delay)
+        client = TiingoClient('stub', workers=workers, base=stub.url)
+        try:
+            start = time.time()
+            if name == 'serial':
+                frames, latencies = {}, {}
+                for symbol in symbols:
+                    began = time.time()
+                    frames[symbol] = client.getlive(symbol)
+                    latencies[symbol] = time.time() - began
+            else:
+                frames, latencies = client.getlive_many(symbols)
+            elapsed = time.time() - start
+        finally:
+            # Close the client's pooled connections first, so the stub's
+            # handler threads aren't left reading from them at shutdown:
+            client.http.close()
+            stub.close()
+
+        results[name] = {
+            'seconds': elapsed,
+            'symbols': len(frames),
+            'requests': stub.requests,
+            'connections': stub.connections,
+            'latency_median': float(np.median(list(latencies.values()))) if latencies else None,
+            'latency_max': max(latencies.values()) if latencies else None,
+        }
+        sys.stderr.write('%-10s %6.2fs For %s Symbols (%s Requests Over %s Connections)\n' % (
+            name, elapsed, len(frames), stub.requests, stub.connections
+        ))
+
+    assert results['concurrent']['symbols'] == args.symbols, 'Not Every Symbol Was Fetched'
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import json
+import numpy as np
+import pandas as pd
+
+
+class MarketData(object):
+    def __init__(self, symbols=5, days=20, seed=0, start='2019-01-02'):
+        ''' Deterministic synthetic market data: `days` business days of
+            regular-session minute bars for each symbol, as a geometric random
+            walk. `symbols` is either a list of names or a count, and the same
+            seed always produces the same bars and payloads
+        '''
+        if isinstance(symbols, int):
+            symbols = ['SYN%03d' % i for i in range(symbols)]
+        self.symbols = list(symbols)
+        self.days = days
+        self.seed = seed
+        self.start = start
+
+    def index(self):
+        ''' Minute timestamps, 9:30 to 15:59 on each business day
+        '''
+        sessions = pd.bdate_range(self.start, periods=self.days)
+        minutes = pd.timedelta_range('9:30:00', periods=390, freq='min')
+        return pd.DatetimeIndex((sessions.values[:, None] + minutes.values[None, :]).ravel())
+
+    def bars(self, symbol):
+        ''' Minute bars for one symbol, with the columns of Tradable.readprices
+        '''
+        random = np.random.RandomState(self.seed * 100003 + self.symbols.index(symbol))
+        index = self.index()
+        count = len(index)
+
+        close = np.round(100. * np.exp(np.cumsum(random.normal(0., 5e-4, count))), 4)
+        open = np.round(np.concatenate([[100.], close[:-1]]), 4)
+        spread = np.abs(random.normal(0., 5e-4, count)) * close
+        high = np.round(np.maximum(open, close) + spread, 4)
+        low = np.round(np.minimum(open, close) - spread, 4)
+
+        return pd.DataFrame({
+            'time': index,
+            'open': open,
+            'high': high,
+            'low': low,
+            'close': close,
+            'volume': random.randint(100, 100000, count),
+        }, columns=['time', 'open', 'high', 'low', 'close', 'volume'])
+
+    def pricepayload(self, symbol):
+        ''' An AlphaVantage TIME_SERIES_INTRADAY (1min) response for the symbol
+        '''
+        bars = self.bars(symbol)
+        times = bars.time.dt.strftime('%Y-%m-%d %H:%M:%S')
+        series = dict(
+            (timestamp, {
+                '1. open': '%.4f' % bar[0],
+                '2. high': '%.4f' % bar[1],
+                '3. low': '%.4f' % bar[2],
+                '4. close': '%.4f' % bar[3],
+                '5. volume': '%d' % bar[4],
+            })
+            for timestamp, bar in zip(times, bars[['open', 'high', 'low', 'close', 'volume']].values.tolist())
+        )
+        return {
+            'Meta Data': {
+                '1. Information': 'Intraday (1min) open, high, low, close prices and volume',
+                '2. Symbol': symbol,
+                '3. Last Refreshed': times.iloc[-1],
+                '4. Interval': '1min',
+                '5. Output Size': 'Full size',
+                '6. Time Zone': 'US/Eastern',
+            },
+            'Time Series (1min)': series,
+        }
+
+    def technicalpayload(self, symbol, function='SMA', time_period=5):
+        ''' An AlphaVantage daily SMA or EMA response for the symbol, computed
+            from the daily closes of its bars
+        '''
+        bars = self.bars(symbol)
+        closes = bars.groupby(bars.time.dt.date).close.last()
+        if function == 'EMA':
+            values = closes.ewm(span=time_period, adjust=False).mean()
+        else:
+            values = closes.rolling(time_period).mean()
+        values = values.dropna()
+
+        return {
+            'Meta Data': {
+                '1: Symbol': symbol,
+                '2: Indicator': function,
+                '3: Last Refreshed': str(values.index[-1]) if len(values) else None,
+                '4: Interval': 'daily',
+                '5: Time Period': time_period,
+                '6: Series Type': 'close',
+                '7: Time Zone': 'US/Eastern',
+            },
+            'Technical Analysis: %s' % function: dict(
+                (date.strftime('%Y-%m-%d'), {function: '%.4f' % value})
+                for date, value in values.items()
+            ),
+        }
+
+    def record(self, archive, fetched=None):
+        ''' Seed a ResponseArchive with the intraday price payload of every
+            symbol, under the url a PriceRequest fetches, so that fetch.py
+            can run offline against it with FINCORE_REPLAY=1
+        '''
+        url = 'https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY&symbol=%s&interval=1min&outputsize=full'
+        return [
+            archive.put(url % symbol, json.dumps(self.pricepayload(symbol)), fetched=fetched)
+            for symbol in self.symbols
+        ]
+
+    def __repr__(self):
+        return '<MarketData %s Symbols x %s Days (Seed %s)>' % (len(self.symbols), self.days, self.seed)
@@ -0,0 +1,197 @@
+import sys
+import time
+import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import Date
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class BulkLoader(object):
+    def __init__(self, session):
+        ''' Columnar bulk ingestion into the session's database. On PostgreSQL
+            rows are streamed with COPY FROM STDIN into a staging table and
+            merged from there; elsewhere (e.g. SQLite) they are inserted with
+            a single executemany. Either way, rows conflicting with an
+            existing row on the given unique keys are skipped, or with
+            `update` columns, overwrite those columns of the existing row.
+            The number of existing rows whose values changed is kept in
+            `updated`
+        '''
+        self.session = session
+        self.updated = 0
+
+    @property
+    def dialect(self):
+        return self.session.get_bind().dialect.name
+
+    def load(self, table, frame, keys, update=None):
+        ''' Insert the rows of a dataframe, whose columns are named after the
+            table's columns, returning the number of rows sent
+        '''
+        self.updated = 0
+        if not len(frame):
+            return 0
+        if self.dialect == 'postgresql':
+            self._copy(table, frame, keys, update or [])
+        else:
+            self._executemany(table, frame, keys, update or [])
+        return len(frame)
+
+    def _columns(self, columns):
+        return ', '.join('"%s"' % column for column in columns)
+
+    def _copy(self, table, frame, keys, update):
+        ''' COPY the frame into a temporary staging table, then merge it into
+            the target table: the update columns of existing rows are updated
+            where they differ, and new rows inserted with ON CONFLICT DO NOTHING
+        '''
+        columns = self._columns(frame.columns)
+        staging = '%s_staging' % table.name
+
+        # Serialize the columns straight to CSV; %.17g round-trips doubles and
+        # writes whole numbers (e.g. volumes held as floats) without a '.0':
+        buffer = StringIO()
+        frame.to_csv(buffer, index=False, header=False, float_format='%.17g', date_format='%Y-%m-%d %H:%M:%S.%f')
+        buffer.seek(0)
+
+        # Use the session's own DBAPI connection, so this runs in the same
+        # transaction as the rest of the session's work:
+        cursor = self.session.connection().connection.cursor()
+        try:
+            cursor.execute('CREATE TEMP TABLE IF NOT EXISTS %s AS SELECT %s FROM %s WITH NO DATA' % (
+                staging, columns, table.name
+            ))
+            cursor.execute('TRUNCATE %s' % staging)
+            cursor.copy_expert('COPY %s (%s) FROM STDIN WITH CSV' % (staging, columns), buffer)
+            if update:
+                cursor.execute('UPDATE %s SET %s FROM %s WHERE %s AND (%s)' % (
+                    table.name,
+                    ', '.join('"%s" = %s."%s"' % (column, staging, column) for column in update),
+                    staging,
+                    ' AND '.join('%s."%s" = %s."%s"' % (table.name, key, staging, key) for key in keys),
+                    ' OR '.join('%s."%s" IS DISTINCT FROM %s."%s"' % (table.name, column, staging, column) for column in update),
+                ))
+                self.updated = cursor.rowcount
+            cursor.execute('INSERT INTO %s (%s) SELECT %s FROM %s ON CONFLICT (%s) DO NOTHING' % (
+                table.name, columns, columns, staging, self._columns(keys)
+            ))
+            cursor.execute('TRUNCATE %s' % staging)
+        finally:
+            cursor.close()
+
+    def _executemany(self, table, frame, keys, update):
+        ''' Single executemany fallback for databases without COPY (plus one
+            for the updates). SQLite's INSERT OR IGNORE skips rows conflicting
+            on any unique constraint
+        '''
+        frame = frame.copy()
+        for column in frame.columns:
+            if np.issubdtype(frame[column].dtype, np.datetime64):
+                # Match the formats SQLAlchemy stores SQLite dates and
+                # datetimes in:
+                dateonly = column in table.c and isinstance(table.c[column].type, Date)
+                frame[column] = frame[column].dt.strftime('%Y-%m-%d' if dateonly else '%Y-%m-%d %H:%M:%S.%f')
+        values = frame.astype(object).where(frame.notnull(), None)
+
+        verb = 'INSERT OR IGNORE' if self.dialect == 'sqlite' else 'INSERT'
+        statement = '%s INTO %s (%s) VALUES (%s)' % (
+            verb, table.name, self._columns(frame.columns), ', '.join(['?'] * len(frame.columns))
+        )
+        cursor = self.session.connection().connection.cursor()
+        try:
+            if update:
+                distinct = 'IS NOT' if self.dialect == 'sqlite' else '<>'
+                cursor.executemany('UPDATE %s SET %s WHERE %s AND (%s)' % (
+                    table.name,
+                    ', '.join('"%s" = ?' % column for column in update),
+                    ' AND '.join('"%s" = ?' % key for key in keys),
+                    ' OR '.join('"%s" %s ?' % (column, distinct) for column in update),
+                ), values[list(update) + list(keys) + list(update)].values.tolist())
+                self.updated = cursor.rowcount
+            cursor.executemany(statement, values.values.tolist())
+        finally:
+            cursor.close()
+
+
+if __name__ == '__main__':
+    # Compare ingestion rows/sec against the ORM path, on a scratch database
+    # given as the first argument (a temporary SQLite file by default):
+    import tempfile
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from base import Base
+    from models import Tradable, PriceRequest, Price
+
+    dbpath = sys.argv[1] if len(sys.argv) > 1 else 'sqlite:///%s' % tempfile.mktemp(suffix='.db')
+    engine = create_engine(dbpath)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    bars = 20000
+    start = datetime.datetime(2019, 1, 2, 9, 30)
+    data = dict(
+        ((start + datetime.timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S'), {
+            '1. open': '%.4f' % (100 + i * 0.01),
+            '2. high': '%.4f' % (100.5 + i * 0.01),
+            '3. low': '%.4f' % (99.5 + i * 0.01),
+            '4. close': '%.4f' % (100.1 + i * 0.01),
+            '5. volume': str(1000 + i),
+        })
+        for i in range(bars)
+    )
+
+    def request(name):
+        tradable = Tradable(name=name)
+        session.add(tradable)
+        session.commit()
+        pricerequest = PriceRequest(tradable_id=tradable.id)
+        session.add(pricerequest)
+        session.commit()
+        return pricerequest
+
+    # ORM path, one Price object per bar:
+    pricerequest = request('ORM')
+    began = time.time()
+    prices = []
+    for timestamp in list(data.keys()):
+        point = data[timestamp]
+        prices.append(Price(
+            request_id=pricerequest.id,
+            tradable_id=pricerequest.tradable_id,
+            time=datetime.datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S'),
+            open=float(point['1. open']),
+            high=float(point['2. high']),
+            low=float(point['3. low']),
+            volume=int(point['5. volume']),
+            close=float(point['4. close']),
+        ))
+    session.bulk_save_objects(prices)
+    session.commit()
+    orm = time.time() - began
+
+    # Columnar path:
+    pricerequest = request('BULK')
+    began = time.time()
+    frame = pd.DataFrame.from_dict(data, orient='index')
+    prices = pd.DataFrame({
+        'request_id': pricerequest.id,
+        'tradable_id': pricerequest.tradable_id,
+        'time': pd.to_datetime(frame.index, format='%Y-%m-%d %H:%M:%S'),
+        'open': pd.to_numeric(frame['1. open']).values,
+        'high': pd.to_numeric(frame['2. high']).values,
+        'low': pd.to_numeric(frame['3. low']).values,
+        'close': pd.to_numeric(frame['4. close']).values,
+        'volume': pd.to_numeric(frame['5. volume']).values,
+    })
+    BulkLoader(session).load(Price.__table__, prices, ['tradable_id', 'time'])
+    session.commit()
+    bulk = time.time() - began
+
+    print('%s (%s Bars)' % (engine.url, bars))
+    print('ORM:  %.0f Rows/s (%.2fs)' % (bars / orm, orm))
+    print('Bulk: %.0f Rows/s (%.2fs)' % (bars / bulk, bulk))
@@ -1,8 +1,15 @@
+import datetime
 from sqlalchemy import create_engine
 from base import Base
 
 if __name__ == '__main__':
     # Initialize the database with all the models found in models.py
-    from session import engine
+    from session import getengine
     from models import *
-    Base.metadata.create_all(engine)
+    Base.metadata.create_all(getengine())
+
+    # With monthly partitioning, attach the current month's partition up
+    # front; the rest are created as prices arrive:
+    today = datetime.date.today()
+    Partitions(session).ensure(today, today)
+    session.commit()
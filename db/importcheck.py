@@ -0,0 +1,60 @@
+''' Import-Time Budget Check
+
+    Importing the models must stay cheap, since every worker process pays for
+    it: no database connection, no prompt, and no engine until first use. This
+    imports db.models in a fresh interpreter and fails if that takes longer
+    than FINCORE_IMPORT_BUDGET seconds (1.0 by default), builds the engine, or
+    imports the utils package (and with it requests, the Tiingo client and
+    the indicator engine), which is only loaded on first use. The budget
+    covers SQLAlchemy and pandas/numpy, which the models need at import.
+
+    Usage, from anywhere: python db/importcheck.py
+'''
+import os
+import sys
+import json
+import subprocess
+
+CHECK = '''
+import sys, json, time
+start = time.time()
+import db.models
+elapsed = time.time() - start
+import db.session
+print(json.dumps({'elapsed': elapsed, 'engine': db.session._engine is not None, 'utils': 'utils' in sys.modules}))
+'''
+
+
+class ImportCheck(object):
+
+    @classmethod
+    def measure(cls):
+        ''' Import db.models in a new interpreter, with stdin closed so any
+            prompt would fail instead of hang, returning (elapsed, engine,
+            utils)
+        '''
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with open(os.devnull) as devnull:
+            output = subprocess.check_output([sys.executable, '-c', CHECK], cwd=root, stdin=devnull)
+        result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        return result['elapsed'], result['engine'], result['utils']
+
+    @classmethod
+    def run(cls, budget=None):
+        ''' Returns True if the import is within budget, and built no engine
+            and imported no utils
+        '''
+        budget = budget or float(os.environ.get('FINCORE_IMPORT_BUDGET', 1.0))
+        elapsed, engine, utils = cls.measure()
+        print('Imported db.models In %.3fs (Budget %.3fs)' % (elapsed, budget))
+        if engine:
+            print('Error: Importing db.models Created The Database Engine')
+        if utils:
+            print('Error: Importing db.models Imported The utils Package')
+        if elapsed > budget:
+            print('Error: Import Time Over Budget')
+        return not engine and not utils and elapsed <= budget
+
+
+if __name__ == '__main__':
+    sys.exit(0 if ImportCheck.run() else 1)
@@ -0,0 +1,182 @@
+''' Schema Migrations For Existing Databases
+
+    New databases get the current schema straight from dbinit.py, so these are
+    only needed to bring an older database up to date. Each migration is safe
+    to run more than once.
+'''
+import time
+from base import Base
+from session import session, getengine
+
+
+class Migrations(object):
+
+    @classmethod
+    def create_tables(cls):
+        ''' Create any tables that don't exist yet
+        '''
+        import models
+        Base.metadata.create_all(getengine())
+
+    @classmethod
+    def price_tradable(cls):
+        ''' Denormalize tradable_id onto the price table and index it by
+            (tradable_id, time)
+        '''
+        print('Adding price.tradable_id...')
+        start = time.time()
+        session.execute('''
+            ALTER TABLE price
+            ADD COLUMN IF NOT EXISTS tradable_id INTEGER REFERENCES tradable(id);
+        ''')
+        session.execute('''
+            UPDATE price SET tradable_id = price_request.tradable_id
+            FROM price_request
+            WHERE price.request_id = price_request.id
+            AND price.tradable_id IS NULL;
+        ''')
+        session.execute('''
+            CREATE INDEX IF NOT EXISTS ix_price_tradable_time
+            ON price (tradable_id, time);
+        ''')
+        session.commit()
+        print('Added price.tradable_id in %.2fs' % (time.time() - start))
+
+    @classmethod
+    def price_unique(cls):
+        ''' Remove duplicate prices and replace the (tradable_id, time) index
+            with a unique constraint, so that ingestion can upsert
+        '''
+        print('Adding unique price constraint...')
+        start = time.time()
+        session.execute('''
+            DELETE FROM price p USING price q
+            WHERE p.tradable_id = q.tradable_id
+            AND p.time = q.time
+            AND p.id > q.id;
+        ''')
+        session.execute('''
+            ALTER TABLE price ALTER COLUMN tradable_id SET NOT NULL;
+        ''')
+        session.execute('''
+            ALTER TABLE price DROP CONSTRAINT IF EXISTS uq_price_tradable_time;
+        ''')
+        session.execute('''
+            ALTER TABLE price
+            ADD CONSTRAINT uq_price_tradable_time UNIQUE (tradable_id, time);
+        ''')
+        session.execute('''
+            DROP INDEX IF EXISTS ix_price_tradable_time;
+        ''')
+        session.commit()
+        print('Added unique price constraint in %.2fs' % (time.time() - start))
+
+    @classmethod
+    def technical_points(cls):
+        ''' Backfill typed technical indicator points from the legacy JSON
+            technical_indicator_value rows
+        '''
+        print('Backfilling technical indicator points...')
+        start = time.time()
+        session.execute('''
+            INSERT INTO technical_indicator_point
+                (tradable_id, technical_indicator_id, field, date, value, request_id)
+            SELECT request.tradable_id, request.technical_indicator_id, field.key,
+                value.date, CAST(field.value AS DOUBLE PRECISION), value.request_id
+            FROM technical_indicator_value value
+            INNER JOIN technical_request request ON request.id = value.request_id
+            CROSS JOIN LATERAL JSONB_EACH_TEXT(CAST(value.values AS JSONB)) field
+            ON CONFLICT DO NOTHING;
+        ''')
+        session.commit()
+        print('Backfilled technical indicator points in %.2fs' % (time.time() - start))
+
+    @classmethod
+    def price_types(cls):
+        ''' Convert the price columns to the configured FINCORE_PRICE_TYPE, and
+            volume to BIGINT. This rewrites the table, so it also reclaims the
+            space used by the old column values
+        '''
+        from models import PRICE_TYPE
+        pricetype = {
+            'numeric': 'NUMERIC',
+            'double': 'DOUBLE PRECISION',
+            'real': 'REAL',
+        }[PRICE_TYPE]
+
+        print('Converting price columns to %s...' % pricetype)
+        start = time.time()
+        session.execute('''
+            ALTER TABLE price
+            ALTER COLUMN open TYPE %(type)s,
+            ALTER COLUMN high TYPE %(type)s,
+            ALTER COLUMN low TYPE %(type)s,
+            ALTER COLUMN close TYPE %(type)s,
+            ALTER COLUMN volume TYPE BIGINT;
+        ''' % {'type': pricetype})
+        session.commit()
+        print('Converted price columns in %.2fs' % (time.time() - start))
+
+    @classmethod
+    def price_partitions(cls):
+        ''' Convert the price table to a monthly partitioned table, when
+            FINCORE_PRICE_PARTITION=monthly. The rows are copied over into one
+            partition per month, and the old table is kept as
+            price_unpartitioned until it is dropped by hand
+        '''
+        from partition import Partitions, PARTITIONED
+        partitions = Partitions(session)
+        if not PARTITIONED or partitions.partitioned():
+            return
+
+        print('Partitioning price table by month...')
+        start = time.time()
+
+        # Free up the constraint names for the new table, which keeps using
+        # the old id sequence:
+        session.execute('''
+            ALTER TABLE price RENAME CONSTRAINT price_pkey TO price_unpartitioned_pkey;
+        ''')
+        session.execute('''
+            ALTER TABLE price RENAME CONSTRAINT uq_price_tradable_time TO uq_price_unpartitioned_tradable_time;
+        ''')
+        session.execute('''
+            CREATE TABLE price_partitioned (LIKE price INCLUDING DEFAULTS)
+            PARTITION BY RANGE (time);
+        ''')
+        session.execute('''
+            ALTER TABLE price_partitioned
+            ADD CONSTRAINT price_pkey PRIMARY KEY (id, time),
+            ADD CONSTRAINT uq_price_tradable_time UNIQUE (tradable_id, time),
+            ADD FOREIGN KEY (tradable_id) REFERENCES tradable(id),
+            ADD FOREIGN KEY (request_id) REFERENCES price_request(id);
+        ''')
+
+        # One partition per month of existing data, then copy everything:
+        first, last = session.execute('SELECT MIN(time), MAX(time) FROM price;').fetchone()
+        if first is not None:
+            for month in partitions.months(first, last):
+                partitions.create(month, parent='price_partitioned')
+        session.execute('INSERT INTO price_partitioned SELECT * FROM price;')
+
+        # Swap the tables:
+        session.execute('ALTER TABLE price RENAME TO price_unpartitioned;')
+        session.execute('ALTER TABLE price_partitioned RENAME TO price;')
+        session.execute('ALTER SEQUENCE price_id_seq OWNED BY price.id;')
+        session.commit()
+        print('Partitioned price table in %.2fs, drop price_unpartitioned once verified' % (time.time() - start))
+
+    @classmethod
+    def run(cls):
+        ''' Run all migrations, in order
+        '''
+        cls.create_tables()
+        cls.price_tradable()
+        cls.price_unique()
+        cls.technical_points()
+        cls.price_types()
+        cls.price_partitions()
+
+
+if __name__ == '__main__':
+    Migrations.run()
@@ -1,14 +1,21 @@
+import os
+import sys
 import json
 import time
-import requests
+import traceback
 import datetime
+import numpy as np
 import pandas as pd
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, \
-        Date, Numeric, Boolean, UniqueConstraint
-from sqlalchemy.orm import relationship
+from collections import OrderedDict
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, \
+        Date, Numeric, Float, Boolean, UniqueConstraint, text, bindparam
+from sqlalchemy.orm import relationship, object_session
 from dateutil.relativedelta import relativedelta
 from base import Base
-from session import session, engine
+from session import session, getengine, Session, session_scope
+from pricecache import PriceCache
+from bulkload import BulkLoader
+from partition import Partitions, PARTITIONED
 
 # Try to import the API Key:
 try:
@@ -17,6 +24,95 @@ except ImportError:
     API_KEY = None
     print('Warning: No AlphaVantage API Key Provided, Data Fetching Disabled...')
 
+# Storage type for price columns, configurable through FINCORE_PRICE_TYPE. The
+# default 'numeric' is exact but is read back as Decimal objects, while
+# 'double' and 'real' are compact and read back as floats. Existing
+# databases are converted with db/migrate.py:
+PRICE_TYPES = {
+    'numeric': Numeric,
+    'double': Float(precision=53),
+    'real': Float(precision=24),
+}
+PRICE_TYPE = os.environ.get('FINCORE_PRICE_TYPE', 'numeric')
+PriceType = PRICE_TYPES[PRICE_TYPE]
+
+
+def _utils():
+    ''' The utils package, which holds the instrumentation and the response
+        archive. It is only imported on first use, since it pulls in
+        requests, the Tiingo client and the indicator engine, and isn't on
+        the path for the scripts run from within db/ (dbinit.py, migrate.py)
+    '''
+    try:
+        import utils
+    except ImportError:
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        import utils
+    return utils
+
+
+def getmetrics():
+    ''' The process-wide Metrics registry
+    '''
+    return _utils().Metrics.shared()
+
+
+def getarchive():
+    ''' The process-wide ResponseArchive
+    '''
+    return _utils().ResponseArchive.shared()
+
+
+def sessionfor(instance=None, given=None):
+    ''' The session to work in: the one given, else the one the instance is
+        attached to, else the calling thread's scoped session
+    '''
+    if given is not None:
+        return given
+    if instance is not None:
+        attached = object_session(instance)
+        if attached is not None:
+            return attached
+    return session
+
+
+def upsert(table, rows, keys, session=None, update=None):
+    ''' Bulk insert the given rows (a dataframe, or a list of dicts), skipping
+        any that conflict with an existing row on the given unique keys. With
+        `update` columns, conflicting rows overwrite those columns instead,
+        and any stored values that changed are counted and warned about
+    '''
+    frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+    metrics = getmetrics()
+    loader = BulkLoader(sessionfor(given=session))
+    with metrics.timer('ingest_seconds', labels={'table': table.name}):
+        count = loader.load(table, frame, keys, update=update)
+    metrics.increment('ingest_rows_total', count, labels={'table': table.name})
+    if loader.updated:
+        metrics.increment('ingest_updates_total', loader.updated, labels={'table': table.name})
+        print('WARNING: Overwrote %s Changed Values In %s' % (loader.updated, table.name))
+    return count
+
+
+def readsql(query, name, parse_dates=None, params=None):
+    ''' Run a read query into a dataframe, timing it into the db_read_seconds
+        histogram under the given query name. Columns in `parse_dates` are
+        parsed as datetimes, which SQLite otherwise returns as strings.
+        `params` are bound to the query's :name placeholders; datetimes are
+        bound as DateTimes, so they compare in the format the database
+        stores them in (SQLite keeps the microseconds)
+    '''
+    if params:
+        query = text(query).bindparams(*[
+            bindparam(key, value, type_=DateTime() if isinstance(value, datetime.datetime) else None)
+            for key, value in params.items()
+        ])
+    metrics = getmetrics()
+    with metrics.timer('db_read_seconds', labels={'query': name}):
+        frame = pd.read_sql(query, getengine(), parse_dates=parse_dates)
+    metrics.increment('db_read_rows_total', len(frame), labels={'query': name})
+    return frame
+
 
 class Tradable(Base):
     ''' Class to Represent a Stock Market Equity
@@ -29,12 +125,17 @@ class Tradable(Base):
     price_requests = relationship('PriceRequest')
     technical_requests = relationship('TechnicalRequest')
 
-    def getreturns(self):
-        '''
+    def getreturns(self, interval='1min'):
+        ''' Get returns at the given bar interval (1min, or one of the
+            ROLLUP_INTERVALS)
         '''
         # Get price history:
-        prices = self.getprices()
+        return self.toreturns(self.getprices(interval=interval))
 
+    @classmethod
+    def toreturns(cls, prices):
+        ''' Convert a price dataframe (as returned by getprices) into returns
+        '''
         # Compute price returns based on previous close:
         prices['price'] = prices.close.copy()
         prices['prev'] = prices.close.shift(1)
@@ -49,49 +150,197 @@ class Tradable(Base):
         return returns
 
     def pricerange(self, start, end):
-        ''' Get prices in the given date range
+        ''' Get prices in the given date range, with the date bounds applied in
+            the database against the (tradable_id, time) index
         '''
-        prices = self.getprices()
-        m1 = prices.date <= end
-        m2 = prices.date >= start
-        prices = prices[m1 & m2]
-
-        return prices
+        query = '''
+            SELECT id, open, high, low, close, time, volume
+            FROM price
+            WHERE tradable_id=%s AND time >= '%s' AND time < '%s'
+            ORDER BY time;
+        ''' % (self.id, start, end + datetime.timedelta(days=1))
+        prices = readsql(query, 'pricerange', parse_dates=['time'])
+        return self._splittimes(prices)
+
+    def gettechnicals(self, start=None, end=None, session=None):
+        ''' Get all stored technical indicators for this tradable in a single
+            query, as a date-indexed dataframe with one column per indicator
+            field (e.g. SMA.5.SMA, MACD.MACD_Signal)
+        '''
+        session = sessionfor(self, session)
+        query = '''
+            SELECT date, technical_indicator_id, field, value
+            FROM technical_indicator_point
+            WHERE tradable_id=%s
+        ''' % self.id
+        if start:
+            query += " AND date >= '%s'" % start
+        if end:
+            query += " AND date <= '%s'" % end
+        points = readsql(query, 'technicals')
+
+        # Pivot into one column per indicator field:
+        technicals = points.set_index(['date', 'technical_indicator_id', 'field']).value
+        technicals = technicals.unstack(['technical_indicator_id', 'field']).sort_index()
+        labels = dict((indicator.id, indicator.label) for indicator in session.query(TechnicalIndicator).all())
+        technicals.columns = ['%s.%s' % (labels[id], field) for id, field in technicals.columns]
+        return technicals
 
     def pricedates(self):
         ''' Get available price dates
         '''
         query = '''
             SELECT DISTINCT date(time) FROM price
-            WHERE request_id IN (
-                SELECT price_request.id FROM tradable
-                INNER JOIN price_request
-                ON price_request.tradable_id = tradable.id
-                WHERE tradable.id=%s
-            ) ORDER BY date;
+            WHERE tradable_id=%s
+            ORDER BY date;
         ''' % self.id
-        results = pd.read_sql(query, engine)
+        results = readsql(query, 'pricedates')
         return results.date.tolist()
 
-    def getprices(self):
-        ''' Get all prices
+    def readprices(self, after=None):
+        ''' Read raw prices from the database, optionally only those newer
+            than the given datetime
+        '''
+        query = '''
+            SELECT open, high, low, close, time, volume
+            FROM price
+            WHERE tradable_id=%s
+        ''' % self.id
+        params = None
+        if after is not None:
+            query += ' AND time > :after'
+            params = {'after': after}
+        return readsql(query, 'readprices', parse_dates=['time'], params=params)
+
+    def readarrays(self, start=None, end=None, dtype='float64'):
+        ''' Read prices straight into typed NumPy columns, without building a
+            dataframe or any Decimal objects. Returns an ordered dict of time
+            (datetime64) and open/high/low/close/volume arrays of `dtype`
+        '''
+        query = '''
+            SELECT time,
+                CAST(open AS DOUBLE PRECISION), CAST(high AS DOUBLE PRECISION),
+                CAST(low AS DOUBLE PRECISION), CAST(close AS DOUBLE PRECISION),
+                CAST(volume AS DOUBLE PRECISION)
+            FROM price
+            WHERE tradable_id=%s
+        ''' % self.id
+        if start:
+            query += " AND time >= '%s'" % start
+        if end:
+            query += " AND time < '%s'" % (end + datetime.timedelta(days=1))
+        query += " ORDER BY time"
+
+        metrics = getmetrics()
+        with metrics.timer('db_read_seconds', labels={'query': 'readarrays'}):
+            connection = getengine().raw_connection()
+            try:
+                cursor = connection.cursor()
+                cursor.execute(query)
+                rows = cursor.fetchall()
+                cursor.close()
+            finally:
+                connection.close()
+        metrics.increment('db_read_rows_total', len(rows), labels={'query': 'readarrays'})
+
+        # NULL volumes and prices come back as NaN:
+        values = np.array([row[1:] for row in rows], dtype=dtype).reshape((len(rows), 5))
+        arrays = OrderedDict([('time', np.array([row[0] for row in rows], dtype='datetime64[ns]'))])
+        for i, column in enumerate(['open', 'high', 'low', 'close', 'volume']):
+            arrays[column] = np.ascontiguousarray(values[:, i])
+        return arrays
+
+    def iterprices(self, start=None, end=None, chunksize=10000):
+        ''' Iterate over raw prices in time-ordered chunks of `chunksize` rows,
+            optionally within the given date range, through a server-side
+            cursor so that only one chunk is held in memory at a time
         '''
-        print('Downloading Prices For %s...' % self.name)
-        start = time.time()
         query = '''
-            SELECT open, high, low, close, time, date(time), volume
+            SELECT open, high, low, close, time, volume
             FROM price
-            WHERE request_id IN (
-                SELECT id FROM price_request WHERE tradable_id=%s
-            );
+            WHERE tradable_id=%s
         ''' % self.id
-        prices = pd.read_sql(query, engine).sort_values('time')
-        print('Downloaded %s Prices For %s In %.2fs' % (prices.shape[0], self.name, time.time() - start))
+        if start:
+            query += " AND time >= '%s'" % start
+        if end:
+            query += " AND time < '%s'" % (end + datetime.timedelta(days=1))
+        query += " ORDER BY time"
+
+        connection = getengine().connect().execution_options(stream_results=True)
+        try:
+            for chunk in pd.read_sql(query, connection, chunksize=chunksize, parse_dates=['time']):
+                yield chunk
+        finally:
+            connection.close()
+
+    @classmethod
+    def readmany(cls, tradables, after=None):
+        ''' Read raw prices for several tradables in a single query, optionally
+            only those newer than the given datetime. Returns a dict of
+            tradable id to raw price dataframe
+        '''
+        query = '''
+            SELECT tradable_id, open, high, low, close, time, volume
+            FROM price
+            WHERE tradable_id IN (%s)
+        ''' % ','.join(str(tradable.id) for tradable in tradables)
+        params = None
+        if after is not None:
+            query += ' AND time > :after'
+            params = {'after': after}
+        prices = readsql(query, 'readmany', parse_dates=['time'], params=params)
+
+        grouped = dict(
+            (id, frame.drop('tradable_id', axis=1))
+            for id, frame in prices.groupby('tradable_id')
+        )
+        empty = prices.drop('tradable_id', axis=1).iloc[:0]
+        return dict((tradable.id, grouped.get(tradable.id, empty)) for tradable in tradables)
+
+    def readrollups(self, interval, after=None):
+        ''' Read pre-aggregated bars at one of the ROLLUP_INTERVALS, in the
+            same columns as readprices. Each bar is stamped with the start of
+            its interval
+        '''
+        if interval not in ROLLUP_INTERVALS:
+            raise Exception('Unknown Rollup Interval %s (Expected One Of %s)' % (interval, ', '.join(ROLLUP_INTERVALS)))
+        query = '''
+            SELECT open, high, low, close, time, volume
+            FROM price_rollup
+            WHERE tradable_id=%s AND "interval"='%s'
+        ''' % (self.id, interval)
+        params = None
+        if after is not None:
+            query += ' AND time > :after'
+            params = {'after': after}
+        query += " ORDER BY time"
+        return readsql(query, 'rollups', parse_dates=['time'], params=params)
+
+    def getprices(self, cache=True, interval='1min'):
+        ''' Get all prices, served from the local price cache by default. Any
+            other interval than 1min is read from the price_rollup table,
+            which db/rollup.py keeps up to date
+        '''
+        if interval != '1min':
+            prices = self.readrollups(interval)
+        elif cache:
+            prices = PriceCache.shared().load(self)
+        else:
+            print('Downloading Prices For %s...' % self.name)
+            start = time.time()
+            prices = self.readprices().sort_values('time')
+            print('Downloaded %s Prices For %s In %.2fs' % (prices.shape[0], self.name, time.time() - start))
 
-        # Separate out date and time columns:
+        return self._splittimes(prices)
+
+    @classmethod
+    def _splittimes(cls, prices):
+        ''' Index a raw price dataframe by timestamp and separate out the date
+            and time columns
+        '''
         prices.index = prices.time.copy()
-        prices['date'] = prices.time.map(lambda x: x.date())
-        prices['time'] = prices.time.map(lambda x: x.time())
+        prices['date'] = prices.time.dt.date
+        prices['time'] = prices.time.dt.time
         return prices
 
     def __repr__(self):
@@ -100,23 +349,66 @@ class Tradable(Base):
 
 class Price(Base):
     __tablename__ = 'price'
-    id = Column(Integer, primary_key=True)
-
-    open = Column(Numeric)
-    close = Column(Numeric, nullable=False)
-    low = Column(Numeric)
-    high = Column(Numeric)
-    volume = Column(Integer)
-    time = Column(DateTime, nullable=False)
+    __table_args__ = (
+        UniqueConstraint('tradable_id', 'time', name='uq_price_tradable_time'),
+        # With FINCORE_PRICE_PARTITION=monthly, the table is range partitioned
+        # by time (see partition.py), which PostgreSQL requires to be part of
+        # the primary key:
+        {'postgresql_partition_by': 'RANGE (time)'} if PARTITIONED else {},
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+    open = Column(PriceType)
+    close = Column(PriceType, nullable=False)
+    low = Column(PriceType)
+    high = Column(PriceType)
+    volume = Column(BigInteger)
+    time = Column(DateTime, nullable=False, primary_key=PARTITIONED)
 
     request_id = Column(Integer, ForeignKey('price_request.id'))
     request = relationship('PriceRequest')
 
+    # Denormalized from the request, so that range reads can use the
+    # unique (tradable_id, time) index directly:
+    tradable_id = Column(Integer, ForeignKey('tradable.id'), nullable=False)
+
     def __repr__(self):
         '''
         '''
         return '<%s|%s|%s>' % (self.request.tradable, self.time, float(self.close))
 
+# Bar intervals kept in the price_rollup table, as AlphaVantage names them:
+ROLLUP_INTERVALS = ['5min', '15min', '60min', 'daily']
+
+
+class PriceRollup(Base):
+    ''' OHLCV bar aggregated from the minute prices of one tradable, for one
+        of the ROLLUP_INTERVALS, stamped with the start of its interval
+    '''
+    __tablename__ = 'price_rollup'
+    __table_args__ = (
+        UniqueConstraint('tradable_id', 'interval', 'time', name='uq_price_rollup_tradable_interval_time'),
+    )
+    id = Column(Integer, primary_key=True)
+
+    tradable_id = Column(Integer, ForeignKey('tradable.id'), nullable=False)
+    tradable = relationship('Tradable')
+    interval = Column(String, nullable=False)
+    time = Column(DateTime, nullable=False)
+
+    open = Column(PriceType)
+    close = Column(PriceType, nullable=False)
+    low = Column(PriceType)
+    high = Column(PriceType)
+    volume = Column(BigInteger)
+
+    # Number of minute bars aggregated:
+    count = Column(Integer)
+
+    def __repr__(self):
+        return '<%s|%s|%s|%s>' % (self.tradable, self.interval, self.time, float(self.close))
+
+
 class TechnicalIndicator(Base):
     __tablename__ = 'technical_indicator'
     id = Column(Integer, primary_key=True)
@@ -142,6 +434,16 @@ class TechnicalIndicator(Base):
     def time_period(self):
         return self.serialized().get('time_period')
 
+    @property
+    def label(self):
+        ''' Short column-friendly name, e.g. SMA.5 or MACD
+        '''
+        time_period = self.time_period
+        if time_period:
+            return "%s.%s" % (self.name, time_period)
+        else:
+            return self.name
+
     def __repr__(self):
         time_period = self.time_period
         if time_period:
@@ -173,20 +475,61 @@ class TechnicalIndicatorValue(Base):
             self.values
         )
 
+class TechnicalIndicatorPoint(Base):
+    ''' Typed storage for a single output field of a technical indicator on a
+        given date, e.g. the MACD_Signal field of MACD
+    '''
+    __tablename__ = 'technical_indicator_point'
+    __table_args__ = (
+        UniqueConstraint('tradable_id', 'technical_indicator_id', 'field', 'date', name='uq_technical_indicator_point'),
+    )
+    id = Column(Integer, primary_key=True)
+
+    field = Column(String, nullable=False)
+    date = Column(Date, nullable=False)
+    value = Column(Float)
+
+    tradable_id = Column(Integer, ForeignKey('tradable.id'), nullable=False)
+    technical_indicator_id = Column(Integer, ForeignKey('technical_indicator.id'), nullable=False)
+    technical_indicator = relationship('TechnicalIndicator')
+
+    request_id = Column(Integer, ForeignKey('technical_request.id'))
+    request = relationship('TechnicalRequest')
+
+    def __repr__(self):
+        return "%s.%s @ %s: %s" % (self.technical_indicator.label, self.field, self.date, self.value)
+
 class APIRequest(object):
     sent = Column(Boolean, default=False)
     time_sent = Column(DateTime)
     meta = Column(String)
     successful = Column(Boolean)
 
-    def _send(self):
+    def _send(self, session=None):
+        session = sessionfor(self, session)
         if self.sent:
             return
         else:
-            self.sent = True
-            self.time_sent = datetime.datetime.now()
+            self.marksent()
             session.commit()
-            return requests.get(self.url).json()
+            return self.fetch(self.url)
+
+    def marksent(self):
+        ''' Flag this request as sent, without committing
+        '''
+        self.sent = True
+        self.time_sent = datetime.datetime.now()
+
+    @classmethod
+    def fetch(cls, url):
+        ''' Fetch and parse the JSON response for the given url, through the
+            response archive (so it may be recorded, or replayed). This
+            doesn't touch the database, so it is safe to call from worker
+            threads
+        '''
+        body = getarchive().get(url, api='alphavantage')
+        with getmetrics().timer('json_parse_seconds', labels={'api': 'alphavantage'}):
+            return json.loads(body)
 
 
 class PriceRequest(Base, APIRequest):
@@ -206,9 +549,10 @@ class PriceRequest(Base, APIRequest):
         args = (self.tradable.name, min, API_KEY)
         return 'https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY&symbol=%s&interval=%smin&outputsize=full&apikey=%s' % args
 
-    def send(self, cutoff=None):
+    def send(self, cutoff=None, session=None):
         ''' Sends this PriceRequest to the AlphaVantage API
         '''
+        session = sessionfor(self, session)
         if self.sent:
             # Only send a request once
             print("Request %s already sent" % self.id)
@@ -216,9 +560,13 @@ class PriceRequest(Base, APIRequest):
 
         # Send request:
         print("Sending Price Request %s" % self)
-        result = self._send()
+        result = self._send(session=session)
+        self.receive(result, cutoff=cutoff, session=session)
 
-        # Read in result:
+    def receive(self, result, cutoff=None, session=None):
+        ''' Handle the parsed API response for this PriceRequest
+        '''
+        session = sessionfor(self, session)
         if result.get('Information'):
             # An Error Occurred, Request Unscuccessful
             print("Price Request %s Unsuccessful: %s" % (self.id, result['Information']))
@@ -233,31 +581,44 @@ class PriceRequest(Base, APIRequest):
         session.commit()
 
         # Read in the data:
-        self.readin_data(result.get('Time Series (1min)'))
-
-    def readin_data(self, data):
-        # Loop through data points
-        prices = []
-        for time in list(data.keys()):
-            # Create new Price record
-            open = data[time].get('1. open')
-            high = data[time].get('2. high')
-            low = data[time].get('3. low')
-            close = data[time].get('4. close')
-            volume = data[time].get('5. volume')
-            prices.append(Price(
-                request_id=self.id,
-                time=datetime.datetime.strptime(time, '%Y-%m-%d %H:%M:%S'),
-                open=float(open) if open else None,
-                high=float(high) if high else None,
-                low=float(low) if low else None,
-                volume=int(volume) if volume else None,
-                close=float(close),
-            ))
-
-        # Try bulk insert into database
+        self.readin_data(result.get('Time Series (1min)'), session=session)
+
+    def readin_data(self, data, session=None):
+        ''' Insert the bars we don't already have for this tradable
+        '''
+        session = sessionfor(self, session)
+        if not data:
+            return
+
+        # Parse data points straight into columns:
+        frame = pd.DataFrame.from_dict(data, orient='index')
+        rows = pd.DataFrame({
+            'request_id': self.id,
+            'tradable_id': self.tradable_id,
+            'time': pd.to_datetime(frame.index, format='%Y-%m-%d %H:%M:%S'),
+            'open': pd.to_numeric(frame['1. open']).values,
+            'high': pd.to_numeric(frame['2. high']).values,
+            'low': pd.to_numeric(frame['3. low']).values,
+            'close': pd.to_numeric(frame['4. close']).values,
+            'volume': pd.to_numeric(frame['5. volume']).values,
+        })
+
+        # Skip timestamps that are already stored, most of an outputsize=full
+        # response overlaps with the previous fetch:
+        earliest = rows.time.min().to_pydatetime()
+        stored = session.query(Price.time) \
+            .filter(Price.tradable_id == self.tradable_id) \
+            .filter(Price.time >= earliest) \
+            .all()
+        stored = [ts for ts, in stored]
+        rows = rows[~rows.time.isin(stored)]
+        print('Inserting %s New Prices For %s (%s Already Stored)' % (len(rows), self.tradable.name, len(stored)))
+
+        # Try bulk upsert into database, creating any monthly partitions the
+        # new rows fall in first:
         try:
-            session.bulk_save_objects(prices)
+            Partitions(session).ensure(rows.time.min(), rows.time.max())
+            upsert(Price.__table__, rows, ['tradable_id', 'time'], session=session)
         except:
             print("Couldn't save price request %s data:" % self.id)
             print(traceback.format_exc())
@@ -277,6 +638,7 @@ class TechnicalRequest(Base, APIRequest):
     id = Column(Integer, primary_key=True)
 
     values = relationship('TechnicalIndicatorValue')
+    points = relationship('TechnicalIndicatorPoint')
 
     # Technical Indicator Requests need a tradable and a technical indicator:
     tradable = relationship('Tradable')
@@ -284,7 +646,8 @@ class TechnicalRequest(Base, APIRequest):
     technical_indicator_id = Column(Integer, ForeignKey('technical_indicator.id'), nullable=True)
     technical_indicator = relationship('TechnicalIndicator')
 
-    def last_successful_request(self):
+    def last_successful_request(self, session=None):
+        session = sessionfor(self, session)
         return session.query(TechnicalRequest) \
             .filter_by(tradable_id=self.tradable_id) \
             .filter_by(technical_indicator_id=self.technical_indicator_id) \
@@ -303,7 +666,8 @@ class TechnicalRequest(Base, APIRequest):
             args
         )
 
-    def send(self, cutoff=None):
+    def send(self, cutoff=None, session=None):
+        session = sessionfor(self, session)
         if self.sent:
             # Only send a request once
             print("Request %s already sent" % self.id)
@@ -311,9 +675,13 @@ class TechnicalRequest(Base, APIRequest):
 
         # Send request:
         print("Sending Technical Request %s..." % self)
-        result = self._send()
+        result = self._send(session=session)
+        self.receive(result, cutoff=cutoff, session=session)
 
-        # Read in result:
+    def receive(self, result, cutoff=None, session=None):
+        ''' Handle the parsed API response for this TechnicalRequest
+        '''
+        session = sessionfor(self, session)
         if result.get('Information'):
             # An Error Occurred, Request Unscuccessful
             print("Technical Request %s Unsuccessful: %s" % (self.id, result['Information']))
@@ -336,31 +704,35 @@ class TechnicalRequest(Base, APIRequest):
 
         # Read in the data:
         fn_name = self.technical_indicator.serialized().get('function')
-        self.readin_data(result.get('Technical Analysis: ' + fn_name), cutoff=cutoff)
+        self.readin_data(result.get('Technical Analysis: ' + fn_name), cutoff=cutoff, session=session)
 
-    def readin_data(self, data, cutoff=None):
-        # Loop through data points
-        values = []
-        for timestamp, rawdata in data.iteritems():
-            try:
-                # We sometimes get a weird ' hh:mm:ss' appended to the string, so
-                # here we make sure that that is removed from the parsed date string:
-                timestamp = timestamp.split(' ')[0]
-                date = datetime.datetime.strptime(timestamp, '%Y-%m-%d').date()
-                if cutoff and date < cutoff:
-                    continue
-                value = TechnicalIndicatorValue(request_id=self.id, date=date, values=json.dumps(rawdata))
-                values.append(value)
-
-            except Exception as e:
-                raise e
-                print("Invalid Data Point, Skipping (%s: %s)" % (timestamp, rawdata))
-                continue
-
-
-        # Try bulk insert into database
+    def readin_data(self, data, cutoff=None, session=None):
+        ''' Store each field of each data point as a typed indicator value
+        '''
+        session = sessionfor(self, session)
+        if not data:
+            return
+
+        # Parse data points straight into columns. We sometimes get a weird
+        # ' hh:mm:ss' appended to the date strings, so that is removed here:
+        frame = pd.DataFrame.from_dict(data, orient='index')
+        frame.index = pd.to_datetime(frame.index.str.split(' ').str[0], format='%Y-%m-%d').date
+        if cutoff:
+            frame = frame[frame.index >= cutoff]
+
+        # One row per (date, field):
+        rows = frame.apply(pd.to_numeric).stack().reset_index()
+        rows.columns = ['date', 'field', 'value']
+        rows['request_id'] = self.id
+        rows['tradable_id'] = self.tradable_id
+        rows['technical_indicator_id'] = self.technical_indicator_id
+
+        # Try bulk upsert into database
         try:
-            session.bulk_save_objects(values)
+            upsert(
+                TechnicalIndicatorPoint.__table__, rows, ['tradable_id', 'technical_indicator_id', 'field', 'date'],
+                session=session, update=['value']
+            )
             session.commit()
         except:
             print("Couldn't save technical request %s data:" % self.id)
@@ -0,0 +1,194 @@
+import os
+import sys
+import time
+import datetime
+import numpy as np
+import pandas as pd
+
+# Optional time-based partitioning of the price table, on PostgreSQL only.
+# Set FINCORE_PRICE_PARTITION=monthly before creating (or migrating) the
+# database; the partitions themselves are created as prices arrive:
+PARTITION = os.environ.get('FINCORE_PRICE_PARTITION', '')
+PARTITIONED = PARTITION == 'monthly'
+
+
+class Partitions(object):
+    ''' Monthly range partitions of the price table (price_y2019m01, ...):
+        creating them on demand, and archiving old ones to columnar .npy
+        files so that cold history no longer weighs on the live table
+    '''
+    table = 'price'
+
+    # Archived rows, as typed columnar records:
+    dtype = np.dtype([
+        ('tradable_id', 'int32'),
+        ('time', 'datetime64[ns]'),
+        ('open', 'float64'),
+        ('high', 'float64'),
+        ('low', 'float64'),
+        ('close', 'float64'),
+        ('volume', 'float64'),
+    ])
+    columns = ['open', 'high', 'low', 'close', 'volume']
+
+    def __init__(self, session):
+        self.session = session
+
+    @property
+    def enabled(self):
+        return PARTITIONED and self.session.get_bind().dialect.name == 'postgresql'
+
+    @classmethod
+    def month(cls, value):
+        ''' First day of the month of the given date or datetime
+        '''
+        return datetime.date(value.year, value.month, 1)
+
+    @classmethod
+    def nextmonth(cls, month):
+        return datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+    @classmethod
+    def months(cls, start, end):
+        ''' First days of every month from start to end, inclusive
+        '''
+        month, last = cls.month(start), cls.month(end)
+        while month <= last:
+            yield month
+            month = cls.nextmonth(month)
+
+    @classmethod
+    def name(cls, month):
+        return '%s_y%04dm%02d' % (cls.table, month.year, month.month)
+
+    def partitioned(self):
+        ''' Whether the price table is a partitioned table
+        '''
+        kind = self.session.execute('''
+            SELECT relkind FROM pg_class WHERE relname = '%s' AND pg_table_is_visible(oid);
+        ''' % self.table).scalar()
+        return kind == 'p'
+
+    def partitions(self):
+        ''' Names of the partitions attached to the price table, oldest first
+        '''
+        names = self.session.execute('''
+            SELECT child.relname FROM pg_inherits
+            INNER JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            INNER JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = '%s';
+        ''' % self.table).fetchall()
+        return sorted(name for name, in names)
+
+    def create(self, month, parent=None):
+        ''' Create (if needed) the partition of the given month, returning its
+            name. Runs in the session's transaction, without committing
+        '''
+        name = self.name(month)
+        self.session.execute('''
+            CREATE TABLE IF NOT EXISTS %s PARTITION OF %s
+            FOR VALUES FROM ('%s') TO ('%s');
+        ''' % (name, parent or self.table, month, self.nextmonth(month)))
+        return name
+
+    def ensure(self, start, end):
+        ''' Make sure partitions exist for every month from start to end, so
+            that rows in that range can be inserted. A no-op when partitioning
+            is disabled
+        '''
+        if not self.enabled or pd.isnull(start) or pd.isnull(end):
+            return []
+        return [self.create(month) for month in self.months(start, end)]
+
+    def archive(self, before, path, drop=False):
+        ''' Archive every partition holding only rows before the given date to
+            a columnar .npy file under `path`, then detach it from the price
+            table (and with drop, drop it). Returns the archived partitions
+        '''
+        before = datetime.date(before.year, before.month, before.day)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        archived = []
+        for name in self.partitions():
+            month = datetime.date(int(name[-7:-3]), int(name[-2:]), 1)
+            if self.nextmonth(month) > before:
+                continue
+
+            start = time.time()
+            prices = pd.read_sql('''
+                SELECT tradable_id, time, open, high, low, close, volume
+                FROM %s ORDER BY tradable_id, time;
+            ''' % name, self.session.connection())
+            records = np.empty(len(prices), dtype=self.dtype)
+            records['tradable_id'] = prices.tradable_id.values
+            records['time'] = prices.time.values.astype('datetime64[ns]')
+            for column in self.columns:
+                records[column] = prices[column].values.astype('float64')
+
+            # Write the archive before detaching, atomically:
+            filepath = os.path.join(path, '%s.npy' % name)
+            with open('%s.tmp' % filepath, 'wb') as f:
+                np.save(f, records)
+            os.rename('%s.tmp' % filepath, filepath)
+
+            self.session.execute('ALTER TABLE %s DETACH PARTITION %s;' % (self.table, name))
+            if drop:
+                self.session.execute('DROP TABLE %s;' % name)
+            self.session.commit()
+
+            archived.append(name)
+            print('Archived %s Prices From %s To %s In %.2fs%s' % (
+                len(records), name, filepath, time.time() - start, ' (Dropped)' if drop else ' (Detached)'
+            ))
+        return archived
+
+    def compact(self, name):
+        ''' Rewrite a partition in place to reclaim dead space and refresh its
+            statistics. VACUUM can't run in a transaction, so this uses its
+            own autocommit connection
+        '''
+        start = time.time()
+        connection = self.session.get_bind().connect().execution_options(isolation_level='AUTOCOMMIT')
+        try:
+            connection.execute('VACUUM (FULL, ANALYZE) %s;' % name)
+        finally:
+            connection.close()
+        print('Compacted %s In %.2fs' % (name, time.time() - start))
+
+    @classmethod
+    def readarchive(cls, path, tradable):
+        ''' Read the archived prices of a tradable back from the .npy files
+            under `path`, as a raw price dataframe like readprices returns
+        '''
+        frames = []
+        for filename in sorted(os.listdir(path)) if os.path.isdir(path) else []:
+            if not filename.startswith('%s_y' % cls.table) or not filename.endswith('.npy'):
+                continue
+            records = np.load(os.path.join(path, filename), mmap_mode='r')
+            records = records[records['tradable_id'] == tradable.id]
+            frame = pd.DataFrame({'time': pd.Series(records['time'])})
+            for column in cls.columns:
+                frame[column] = records[column]
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=['time'] + cls.columns)
+        return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == '__main__':
+    # Partition maintenance, e.g.:
+    #   python partition.py list
+    #   python partition.py archive 2019-01-01 /data/archive [drop]
+    #   python partition.py compact price_y2019m01
+    from session import session
+    partitions = Partitions(session)
+    command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+    if command == 'archive':
+        before = datetime.datetime.strptime(sys.argv[2], '%Y-%m-%d').date()
+        partitions.archive(before, sys.argv[3], drop='drop' in sys.argv[4:])
+    elif command == 'compact':
+        partitions.compact(sys.argv[2])
+    else:
+        for name in partitions.partitions():
+            print(name)
@@ -0,0 +1,207 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+
+class PriceCache(object):
+    ''' On-disk columnar cache of minute price histories, one memory-mappable
+        .npy file of typed OHLCV records per tradable
+    '''
+    dtype = np.dtype([
+        ('time', 'datetime64[ns]'),
+        ('open', 'float64'),
+        ('high', 'float64'),
+        ('low', 'float64'),
+        ('close', 'float64'),
+        ('volume', 'float64'),
+    ])
+    columns = ['open', 'high', 'low', 'close', 'volume']
+
+    _shared = None
+
+    def __init__(self, path=None):
+        '''
+        '''
+        self.path = path or self.defaultpath()
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        # Cold/warm load timings, most recent last:
+        self.timings = []
+
+    @classmethod
+    def shared(cls):
+        ''' Process-wide cache instance, created on first use
+        '''
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    @classmethod
+    def defaultpath(cls):
+        ''' Cache directory, configurable through the FINCORE_CACHE variable
+        '''
+        default = '%s/cache' % os.path.dirname(os.path.abspath(__file__))
+        return os.environ.get('FINCORE_CACHE', default)
+
+    def filepath(self, tradable):
+        return '%s/%s.npy' % (self.path, tradable.name)
+
+    def read(self, tradable):
+        ''' Read the cached records for the given tradable, or None if there
+            is no cache file yet
+        '''
+        filepath = self.filepath(tradable)
+        if not os.path.exists(filepath):
+            return None
+        return np.load(filepath, mmap_mode='r')
+
+    def write(self, tradable, records):
+        ''' Atomically replace the cache file for the given tradable
+        '''
+        filepath = self.filepath(tradable)
+        tmppath = '%s.tmp' % filepath
+        with open(tmppath, 'wb') as f:
+            np.save(f, records)
+        os.rename(tmppath, filepath)
+
+    def clear(self, tradable):
+        filepath = self.filepath(tradable)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+    def torecords(self, prices):
+        ''' Convert a raw price dataframe from the database into typed records
+        '''
+        prices = prices.sort_values('time')
+        records = np.empty(len(prices), dtype=self.dtype)
+        records['time'] = prices.time.values.astype('datetime64[ns]')
+        for column in self.columns:
+            records[column] = prices[column].values.astype('float64')
+        return records
+
+    def toframe(self, records):
+        ''' Convert typed records back into a raw price dataframe
+        '''
+        prices = pd.DataFrame({'time': pd.Series(records['time'])})
+        for column in self.columns:
+            prices[column] = records[column]
+        return prices
+
+    def _append(self, tradable, cached, newer):
+        ''' Append newly read rows to the cached records, rewriting the cache
+            file if there are any. Rows at or before the cached high-water
+            mark are dropped, so the cache never holds a bar twice
+        '''
+        highwater = self._highwater(cached)
+        if highwater is not None:
+            newer = newer[newer.time > highwater]
+        if not len(newer):
+            return cached if cached is not None else np.empty(0, dtype=self.dtype)
+        records = self.torecords(newer)
+        if cached is not None and len(cached):
+            records = np.concatenate([np.asarray(cached), records])
+        self.write(tradable, records)
+        return self.read(tradable)
+
+    def _highwater(self, cached):
+        if cached is None or not len(cached):
+            return None
+        return pd.Timestamp(cached['time'][-1]).to_pydatetime()
+
+    def load(self, tradable, refresh=False):
+        ''' Load the full price history for the given tradable. On a cache hit
+            only the rows newer than the cached high-water mark are pulled
+            from the database and appended to the cache file
+        '''
+        if refresh:
+            self.clear(tradable)
+
+        # Read whatever we already have on disk:
+        start = time.time()
+        cached = self.read(tradable)
+        highwater = self._highwater(cached)
+        disktime = time.time() - start
+
+        # Pull any newer rows from the database:
+        start = time.time()
+        mode = 'cold' if highwater is None else 'warm'
+        newer = tradable.readprices(after=highwater)
+        dbtime = time.time() - start
+
+        # Append new rows to the cache file:
+        start = time.time()
+        count = len(cached) if cached is not None else 0
+        cached = self._append(tradable, cached, newer)
+        writetime = time.time() - start
+
+        timing = {
+            'tradable': tradable.name,
+            'mode': mode,
+            'rows': len(cached),
+            'new': len(cached) - count,
+            'disk': disktime,
+            'db': dbtime,
+            'write': writetime,
+        }
+        self.timings.append(timing)
+        print('Loaded %s Prices For %s (%s, %s New) In %.2fs Disk / %.2fs DB / %.2fs Write' % (
+            timing['rows'], tradable.name, mode, timing['new'], disktime, dbtime, writetime
+        ))
+
+        return self.toframe(cached)
+
+    def loadmany(self, tradables):
+        ''' Load the full price histories for several tradables, pulling all of
+            their new rows from the database in a single query. Returns a dict
+            of tradable name to raw price dataframe
+        '''
+        if not tradables:
+            return {}
+
+        # Read whatever we already have on disk:
+        start = time.time()
+        cached = dict((tradable.id, self.read(tradable)) for tradable in tradables)
+        highwaters = dict((id, self._highwater(records)) for id, records in cached.items())
+        disktime = time.time() - start
+
+        # Pull newer rows for all tradables at once, from the oldest high-water
+        # mark; appending trims each tradable's rows to its own:
+        start = time.time()
+        cold = [tradable.name for tradable in tradables if highwaters[tradable.id] is None]
+        after = None if cold else min(highwaters.values())
+        newer = type(tradables[0]).readmany(tradables, after=after)
+        dbtime = time.time() - start
+
+        # Append new rows to the cache files:
+        start = time.time()
+        frames = {}
+        count = 0
+        for tradable in tradables:
+            records = cached[tradable.id]
+            before = len(records) if records is not None else 0
+            records = self._append(tradable, records, newer[tradable.id])
+            count += len(records) - before
+            frames[tradable.name] = self.toframe(records)
+        writetime = time.time() - start
+
+        timing = {
+            'tradable': [tradable.name for tradable in tradables],
+            'mode': 'cold' if cold else 'warm',
+            'rows': sum(len(frame) for frame in frames.values()),
+            'new': count,
+            'disk': disktime,
+            'db': dbtime,
+            'write': writetime,
+        }
+        self.timings.append(timing)
+        print('Loaded %s Prices For %s Tradables (%s Cold, %s New) In %.2fs Disk / %.2fs DB / %.2fs Write' % (
+            timing['rows'], len(tradables), len(cold), count, disktime, dbtime, writetime
+        ))
+
+        return frames
+
+    @property
+    def lasttiming(self):
+        return self.timings[-1] if self.timings else None
@@ -0,0 +1,126 @@
+import time
+import pandas as pd
+from collections import OrderedDict
+from sqlalchemy import func
+from models import session, sessionfor, upsert, readsql, getmetrics, Tradable, PriceRollup, ROLLUP_INTERVALS
+
+
+class Rollups(object):
+    ''' Maintains the price_rollup table: OHLCV bars at each of the
+        ROLLUP_INTERVALS, aggregated from the stored minute prices. Updates
+        are incremental, only re-aggregating from the last stored bar of each
+        interval (which may have been partial) onwards
+    '''
+    # Pandas resampling rule for each interval:
+    rules = {
+        '5min': '5min',
+        '15min': '15min',
+        '60min': '60min',
+        'daily': 'D',
+    }
+    columns = ['open', 'high', 'low', 'close', 'volume']
+
+    @classmethod
+    def aggregate(cls, prices, interval):
+        ''' Aggregate a raw minute price dataframe (as returned by readprices)
+            into bars at the given interval, dropping empty intervals
+        '''
+        prices = prices.sort_values('time').set_index('time')[cls.columns].astype('float64')
+        resampled = prices.resample(cls.rules[interval])
+        bars = resampled.agg(OrderedDict([
+            ('open', 'first'),
+            ('high', 'max'),
+            ('low', 'min'),
+            ('close', 'last'),
+            ('volume', 'sum'),
+        ]))
+        bars['count'] = resampled.close.count()
+        bars = bars[bars['count'] > 0]
+        return bars.reset_index()
+
+    @classmethod
+    def _since(cls, tradable, start):
+        ''' Minute prices at or after the given datetime (all, if None)
+        '''
+        query = '''
+            SELECT open, high, low, close, time, volume
+            FROM price
+            WHERE tradable_id=%s
+        ''' % tradable.id
+        if start is not None:
+            query += " AND time >= '%s'" % start
+        return readsql(query, 'rollup', parse_dates=['time'])
+
+    @classmethod
+    def update(cls, tradable, intervals=None, session=None):
+        ''' Bring the rollups of one tradable up to date with its minute
+            prices, returning a dict of interval to bars written
+        '''
+        session = sessionfor(tradable, session)
+        intervals = intervals or ROLLUP_INTERVALS
+        start = time.time()
+
+        # The last stored bar of each interval, which is rebuilt along with
+        # everything after it:
+        lasts = dict(
+            (interval, session.query(func.max(PriceRollup.time))
+                .filter(PriceRollup.tradable_id == tradable.id)
+                .filter(PriceRollup.interval == interval)
+                .scalar())
+            for interval in intervals
+        )
+        missing = [interval for interval in intervals if lasts[interval] is None]
+        prices = cls._since(tradable, None if missing else min(lasts.values()))
+
+        written = {}
+        for interval in intervals:
+            last = lasts[interval]
+            minutes = prices if last is None else prices[prices.time >= pd.Timestamp(last)]
+            if not len(minutes):
+                written[interval] = 0
+                continue
+
+            bars = cls.aggregate(minutes, interval)
+            bars['tradable_id'] = tradable.id
+            bars['interval'] = interval
+            if last is not None:
+                session.query(PriceRollup) \
+                    .filter(PriceRollup.tradable_id == tradable.id) \
+                    .filter(PriceRollup.interval == interval) \
+                    .filter(PriceRollup.time >= last) \
+                    .delete(synchronize_session=False)
+            written[interval] = upsert(PriceRollup.__table__, bars, ['tradable_id', 'interval', 'time'], session=session)
+        session.commit()
+
+        getmetrics().observe('rollup_seconds', time.time() - start)
+        print('Rolled Up %s Minute Prices For %s Into %s In %.2fs' % (
+            len(prices), tradable.name,
+            ', '.join('%s %s Bars' % (written[interval], interval) for interval in intervals),
+            time.time() - start
+        ))
+        return written
+
+    @classmethod
+    def updateall(cls, tradables=None, intervals=None):
+        ''' Update the rollups of every (or the given) tradables
+        '''
+        tradables = tradables or session.query(Tradable).all()
+        return dict((tradable.name, cls.update(tradable, intervals=intervals)) for tradable in tradables)
+
+    @classmethod
+    def rebuild(cls, tradables=None, intervals=None):
+        ''' Drop and re-aggregate the rollups of every (or the given) tradables
+        '''
+        tradables = tradables or session.query(Tradable).all()
+        for tradable in tradables:
+            session.query(PriceRollup) \
+                .filter(PriceRollup.tradable_id == tradable.id) \
+                .filter(PriceRollup.interval.in_(intervals or ROLLUP_INTERVALS)) \
+                .delete(synchronize_session=False)
+        session.commit()
+        return cls.updateall(tradables, intervals=intervals)
+
+
+if __name__ == '__main__':
+    # Backfill (or catch up) the rollups of every tradable:
+    Rollups.updateall()
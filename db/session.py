@@ -1,7 +1,9 @@
 import os
+import sys
 import getpass
+from contextlib import contextmanager
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
 
 
 
@@ -22,6 +24,10 @@ def getdb():
         from .dbpaths import dbpath
         return dbpath
     except ImportError:
+        # Never block a worker process or an offline tool on a prompt:
+        if not sys.stdin or not sys.stdin.isatty():
+            raise Exception('No Database Available: set FINCORE_DB or create db/dbpaths.py')
+
         # The user hasn't set up a local dbpaths.py file yet, so here we ask if
         # they want to have it wet up manually:
         shouldprompt = raw_input('Error: Database Path Not Configured, Enter Manually? y/N: ').strip() == 'y'
@@ -42,9 +48,73 @@ def getdb():
 
 
 
-dbpath = getdb()
-engine = create_engine(dbpath)
-Session = sessionmaker(bind=engine)
-Session.configure(bind=engine)
+def engineoptions(dbpath):
+    ''' Connection pool options for create_engine, configurable through the
+        FINCORE_POOL_SIZE, FINCORE_MAX_OVERFLOW, FINCORE_POOL_RECYCLE and
+        FINCORE_POOL_PRE_PING environment variables
+    '''
+    options = {
+        'pool_pre_ping': os.environ.get('FINCORE_POOL_PRE_PING', '1') == '1',
+    }
+    if not dbpath.startswith('sqlite'):
+        # SQLite uses its own single-connection pools, which can't be sized:
+        options['pool_size'] = int(os.environ.get('FINCORE_POOL_SIZE', 5))
+        options['max_overflow'] = int(os.environ.get('FINCORE_MAX_OVERFLOW', 10))
+        options['pool_recycle'] = int(os.environ.get('FINCORE_POOL_RECYCLE', 3600))
+    return options
+
+
+def getengine():
+    ''' The shared engine, created on first use from the FINCORE_DB
+        environment variable (or db/dbpaths.py, prompting if neither is set).
+        Nothing connects to the database until this is called
+    '''
+    global _engine
+    if _engine is None:
+        dbpath = os.environ.get('FINCORE_DB') or getdb()
+        _engine = create_engine(dbpath, **engineoptions(dbpath))
+        Session.configure(bind=_engine)
+    return _engine
+
+
+def _newsession():
+    ''' Session factory binding Session to the engine on first use
+    '''
+    getengine()
+    return Session()
+
+
+@contextmanager
+def session_scope():
+    ''' Unit of work in a new session of its own, committed if the block
+        succeeds, rolled back if it raises, and closed either way
+    '''
+    scoped = _newsession()
+    try:
+        yield scoped
+        scoped.commit()
+    except:
+        scoped.rollback()
+        raise
+    finally:
+        scoped.close()
+
+
+def reset():
+    ''' Drop the calling thread's session and all pooled connections. Call
+        this at the start of a forked worker process, so it doesn't share the
+        parent's connections
+    '''
+    session.remove()
+    if _engine is not None:
+        _engine.dispose()
+
+
+# The engine is built lazily by getengine(), so importing this module (or the
+# models) never touches the database:
+_engine = None
+Session = sessionmaker()
 
-session = Session()
+# Thread-local session registry: `session` proxies to a separate session for
+# each thread, so threads never share one
+session = scoped_session(_newsession)
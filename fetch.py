@@ -1,9 +1,16 @@
 import json
 import requests
 import datetime
+import threading
 import traceback
-from time import sleep
 from db.models import *
+from db.rollup import Rollups
+from utils import TokenBucket, IndicatorEngine, Metrics, ResponseArchive
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
 
 
 class CreateRequest(object):
@@ -29,79 +36,127 @@ class CreateRequest(object):
         return techrequests
 
 class Deduplicate(object):
+    # Every price row after the first for the same tradable and timestamp:
+    DUPLICATE_PRICES = '''
+        SELECT id, tradable_id FROM (
+            SELECT id, tradable_id, ROW_NUMBER() OVER (
+                PARTITION BY tradable_id, time ORDER BY id
+            ) AS n
+            FROM price
+        ) ranked
+        WHERE n > 1
+    '''
+
     @classmethod
-    def prices(cls):
-        ''' Deduplicates all Prices for all Tradables in the system
+    def prices(cls, dryrun=False):
+        ''' Deduplicates all Prices for all Tradables in the system, in a single
+            set-based statement. With dryrun, only reports the duplicate
+            counts per tradable. Returns a dict of tradable name to count
         '''
-        tradables = session.query(Tradable).all()
-        for tradable in tradables:
-            start = time.time()
-
-            # When de-deuplicating, only check the past two weeks:
-            _end = datetime.date.today()
-            _start = _end - datetime.timedelta(days=14)
-            prices = tradable.pricerange(_start, _end)
-
-            times = prices[['id', 'time']]
-            seen = set()
-            duplicates = set()
-            for i in range(len(times)):
-                ts = times.iloc[i]['time']
-                if ts in seen:
-                    id = times.iloc[i]['id']
-                    duplicates.add(id)
-                else:
-                    seen.add(ts)
-
-            # Delete duplicate ids:
-            if duplicates:
-                session.execute('''
-                        DELETE FROM price WHERE id IN (%s);
-                    ''' % (
-                        ','.join([str(id) for id in duplicates])
-                    )
+        start = time.time()
+        if dryrun:
+            counts = session.execute('''
+                SELECT tradable.name, COUNT(*) FROM (%s) duplicates
+                INNER JOIN tradable ON tradable.id = duplicates.tradable_id
+                GROUP BY tradable.name;
+            ''' % cls.DUPLICATE_PRICES).fetchall()
+        else:
+            counts = session.execute('''
+                WITH deleted AS (
+                    DELETE FROM price WHERE id IN (SELECT id FROM (%s) duplicates)
+                    RETURNING tradable_id
                 )
-                session.commit()
-
-                print("Deleted %s Duplicates for %s in %.2fs" % (len(duplicates), tradable, time.time() - start))
-            else:
-                print("No Duplicates Found for %s (%.2fs)" % (tradable, time.time() - start))
+                SELECT tradable.name, COUNT(*) FROM deleted
+                INNER JOIN tradable ON tradable.id = deleted.tradable_id
+                GROUP BY tradable.name;
+            ''' % cls.DUPLICATE_PRICES).fetchall()
+            session.commit()
+
+        counts = dict(counts)
+        metrics = Metrics.shared()
+        metrics.observe('dedupe_seconds', time.time() - start, labels={'table': 'price', 'dryrun': dryrun})
+        metrics.increment('duplicates_total', sum(counts.values()), labels={'table': 'price', 'dryrun': dryrun})
+        for name in sorted(counts):
+            print("%s %s Duplicates for %s" % ('Found' if dryrun else 'Deleted', counts[name], name))
+        print("%s %s Price Duplicates in %.2fs" % (
+            'Found' if dryrun else 'Deleted', sum(counts.values()), time.time() - start
+        ))
+        return counts
+
+    # Every indicator value after the first for the same tradable, indicator,
+    # date and (semantically equal) values. Conflicting values for the same
+    # date rank separately, so they are preserved:
+    DUPLICATE_TECHNICALS = '''
+        SELECT id FROM (
+            SELECT value.id, ROW_NUMBER() OVER (
+                PARTITION BY request.tradable_id, request.technical_indicator_id,
+                    value.date, CAST(value.values AS JSONB)
+                ORDER BY value.id
+            ) AS n
+            FROM technical_indicator_value value
+            INNER JOIN technical_request request ON request.id = value.request_id
+        ) ranked
+        WHERE n > 1
+    '''
 
     @classmethod
-    def technicals(cls):
-        ''' Deduplicates all Technical Indicators in the system
+    def technicals(cls, dryrun=False):
+        ''' Deduplicates all Technical Indicators in the system in a handful of
+            set-based statements, warning about (and keeping) any conflicting
+            values for the same date. With dryrun, only reports the duplicate
+            counts. Returns a dict of (tradable name, indicator id) to count
         '''
-        tradables = session.query(Tradable).all()
-        technicals = session.query(TechnicalIndicator).all()
-
-        for tradable in tradables:
-            for technical in technicals:
-                print("Deduplicating %s %s..." % (tradable.name, str(technical)))
-
-                # Collect the Indicator values for this Tradable/Techincal Pair:
-                technical_requests = session.query(TechnicalRequest).filter_by(tradable_id=tradable.id, technical_indicator_id=technical.id).all()
-                indicators = []
-                for request in technical_requests:
-                    indicators += request.values
-
-                count = 0
-                dates = {}
-                for indicator in indicators:
-                    if indicator.date in dates:
-                        # Make sure this is indeed a duplicate:
-                        oldval = json.loads(dates[indicator.date])
-                        newval = json.loads(indicator.values)
-                        if oldval == newval:
-                            count += 1
-                            session.delete(indicator)
-                        else:
-                            print('WARNING: %s != %s (%s)' % (oldval, newval, indicator.date))
-                    else:
-                        dates[indicator.date] = indicator.values
-                session.commit()
-
-                if count:
-                    print("Found %s duplicates" % count)
+        start = time.time()
+        technicals = dict((technical.id, technical) for technical in session.query(TechnicalIndicator).all())
+
+        # Report conflicting values for the same tradable/indicator/date:
+        conflicts = session.execute('''
+            SELECT tradable.name, request.technical_indicator_id, value.date,
+                STRING_AGG(DISTINCT value.values, ' != ')
+            FROM technical_indicator_value value
+            INNER JOIN technical_request request ON request.id = value.request_id
+            INNER JOIN tradable ON tradable.id = request.tradable_id
+            GROUP BY tradable.name, request.technical_indicator_id, value.date
+            HAVING COUNT(DISTINCT CAST(value.values AS JSONB)) > 1;
+        ''').fetchall()
+        for name, technical_id, date, values in conflicts:
+            print('WARNING: %s (%s %s %s)' % (values, name, technicals.get(technical_id), date))
+
+        if dryrun:
+            counts = session.execute('''
+                SELECT tradable.name, request.technical_indicator_id, COUNT(*)
+                FROM technical_indicator_value value
+                INNER JOIN technical_request request ON request.id = value.request_id
+                INNER JOIN tradable ON tradable.id = request.tradable_id
+                WHERE value.id IN (%s)
+                GROUP BY tradable.name, request.technical_indicator_id;
+            ''' % cls.DUPLICATE_TECHNICALS).fetchall()
+        else:
+            counts = session.execute('''
+                WITH deleted AS (
+                    DELETE FROM technical_indicator_value WHERE id IN (%s)
+                    RETURNING request_id
+                )
+                SELECT tradable.name, request.technical_indicator_id, COUNT(*)
+                FROM deleted
+                INNER JOIN technical_request request ON request.id = deleted.request_id
+                INNER JOIN tradable ON tradable.id = request.tradable_id
+                GROUP BY tradable.name, request.technical_indicator_id;
+            ''' % cls.DUPLICATE_TECHNICALS).fetchall()
+            session.commit()
+
+        counts = dict(((name, technical_id), count) for name, technical_id, count in counts)
+        metrics = Metrics.shared()
+        metrics.observe('dedupe_seconds', time.time() - start, labels={'table': 'technical_indicator_value', 'dryrun': dryrun})
+        metrics.increment('duplicates_total', sum(counts.values()), labels={'table': 'technical_indicator_value', 'dryrun': dryrun})
+        for name, technical_id in sorted(counts):
+            print("%s %s Duplicates for %s %s" % (
+                'Found' if dryrun else 'Deleted', counts[(name, technical_id)], name, technicals.get(technical_id)
+            ))
+        print("%s %s Technical Duplicates (%s Conflicts) in %.2fs" % (
+            'Found' if dryrun else 'Deleted', sum(counts.values()), len(conflicts), time.time() - start
+        ))
+        return counts
 
 
 class FetchData(object):
@@ -134,43 +189,197 @@ class FetchData(object):
         return pending
 
     @classmethod
-    def send(cls, requests):
-        ''' Send the given set of Price and Techincal Indicator Requests
+    def compute(cls, tradables=None):
+        ''' Compute the daily technical indicators locally from stored prices
+            for every tradable, without spending any API budget. Values already
+            stored for the same dates (e.g. fetched from AlphaVantage) are kept
+        '''
+        tradables = tradables or session.query(Tradable).all()
+        technicals = [
+            technical for technical in session.query(TechnicalIndicator).all()
+            if technical.serialized().get('interval', 'daily') == 'daily'
+        ]
+        args = [technical.serialized() for technical in technicals]
+
+        failures = 0
+        for tradable in tradables:
+            try:
+                start = time.time()
+                frame = IndicatorEngine.compute(tradable.getprices(), args).get('daily')
+                if frame is None:
+                    continue
+
+                # The indicator and field of each column (e.g. SMA.5.SMA):
+                ids, fields = {}, {}
+                for technical in technicals:
+                    prefix = '%s.' % technical.label
+                    for column in frame.columns:
+                        if column.startswith(prefix):
+                            ids[column], fields[column] = technical.id, column[len(prefix):]
+
+                # One row per (date, column), leaving out missing values:
+                rows = frame[list(ids)].astype('float64').stack().reset_index()
+                rows.columns = ['date', 'column', 'value']
+                rows['tradable_id'] = tradable.id
+                rows['technical_indicator_id'] = rows.column.map(ids)
+                rows['field'] = rows.column.map(fields)
+                rows = rows.drop('column', axis=1)
+
+                # Insert only, so local approximations never replace the
+                # values fetched from AlphaVantage:
+                upsert(TechnicalIndicatorPoint.__table__, rows, ['tradable_id', 'technical_indicator_id', 'field', 'date'])
+                session.commit()
+                print('Computed %s Technical Values For %s In %.2fs' % (len(rows), tradable, time.time() - start))
+            except Exception:
+                # Keep going with the other tradables:
+                print('Exception occured computing technicals for %s:' % tradable)
+                print(traceback.format_exc())
+                session.rollback()
+                failures += 1
+
+        if failures:
+            print('Warning: Computing Technicals Failed For %s Of %s Tradables' % (failures, len(tradables)))
+        return failures
+
+    @classmethod
+    def rollup(cls, tradables=None):
+        ''' Incrementally update the 5min/15min/60min/daily price rollups of
+            every tradable from the newly fetched minute prices
+        '''
+        return Rollups.updateall(tradables)
+
+    @classmethod
+    def send(cls, requests, rpm=4, burst=1, workers=4):
+        ''' Send the given set of Price and Techincal Indicator Requests. The
+            defaults match the AlphaVantage free account limit of 4 requests
+            per minute; raise `rpm` and `burst` for paid keys
         '''
 
         # Determine a cutoff for data history:
         cutoff = datetime.date(2018, 8, 1)
 
-        # Loop through requests and send each:
+        dispatcher = Dispatcher(rpm=rpm, burst=burst, workers=workers)
+        return dispatcher.send(requests, cutoff=cutoff)
+
+
+class Dispatcher(object):
+    def __init__(self, rpm=4, burst=1, workers=4):
+        ''' Sends API Requests from a pool of worker threads, within a token
+            bucket rate limit. Workers only do the HTTP round trip and JSON
+            parsing; responses are handed back to the calling thread to be
+            written to the database, so the shared session is never used
+            concurrently while ingestion overlaps with the next downloads.
+            When replaying from the response archive (FINCORE_REPLAY=1) no
+            API budget is spent, so the rate limit is skipped
+        '''
+        self.replay = ResponseArchive.shared().replay
+        self.limiter = TokenBucket(rpm, burst=burst)
+        self.workers = workers
+        self.metrics = Metrics.shared()
+
+    def _work(self, tasks, results):
+        ''' Worker Thread Loop
+        '''
+        while True:
+            try:
+                request, url = tasks.get_nowait()
+            except Empty:
+                return
+
+            if not self.replay:
+                with self.metrics.timer('ratelimit_wait_seconds'):
+                    self.limiter.acquire()
+            start = time.time()
+            try:
+                result, error = APIRequest.fetch(url), None
+            except:
+                result, error = None, traceback.format_exc()
+            results.put((request, result, error, time.time() - start))
+
+    def send(self, requests, cutoff=None):
+        ''' Send the given requests, returning throughput stats
+        '''
+        start = time.time()
+
+        # Flag requests as sent and resolve their urls up front, here on the
+        # calling thread, since resolving a url may lazy-load relationships:
+        tasks = Queue()
+        pending = []
         for request in requests:
-            print('Sending %s...' % request)
+            if request.sent:
+                print("Request %s already sent" % request.id)
+                continue
+            request.marksent()
+            tasks.put((request, request.url))
+            pending.append(request)
+        session.commit()
+
+        results = Queue()
+        threads = []
+        for i in range(min(self.workers, len(pending))):
+            thread = threading.Thread(target=self._work, args=(tasks, results))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        # Read in responses as they arrive:
+        latencies = []
+        failures = 0
+        for i in range(len(pending)):
+            request, result, error, latency = results.get()
+            latencies.append(latency)
+            print('Received %s In %.2fs' % (request, latency))
             try:
-                request.send(cutoff=cutoff)
-                session.commit()
+                if error:
+                    raise Exception(error)
+                with self.metrics.timer('receive_seconds', labels={'request': type(request).__name__}):
+                    request.receive(result, cutoff=cutoff)
+                    session.commit()
+                self.metrics.increment('requests_total', labels={'request': type(request).__name__, 'status': 'ok'})
 
                 prices = getattr(request, 'prices', [])
                 if prices:
                     print('Found %s Prices for %s' % (len(prices), request))
 
-                values = getattr(request, 'values', [])
-                if values:
-                    print('Found %s Values for %s' % (len(values), request))
+                points = getattr(request, 'points', [])
+                if points:
+                    print('Found %s Values for %s' % (len(points), request))
 
             except:
                 print("Exception occured for %s:" % request)
                 print(traceback.format_exc())
-
-            # Alpha Vantage limits the requests to 4 per minute for the free
-            # account, so here we sleep
-            print("Sleeping 15s...")
-            sleep(15.1)
-
-
-
+                session.rollback()
+                request.successful = False
+                session.commit()
+                failures += 1
+                self.metrics.increment('requests_total', labels={'request': type(request).__name__, 'status': 'failed'})
+
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.time() - start
+        stats = {
+            'requests': len(pending),
+            'failures': failures,
+            'elapsed': elapsed,
+            'achieved': len(pending) / elapsed * 60. if elapsed else 0.,
+            'limit': self.limiter.rpm,
+            'burst': self.limiter.burst,
+            'latency': sum(latencies) / len(latencies) if latencies else 0.,
+        }
+        print('Sent %s Requests (%s Failed) In %.2fs: %.2f/min Achieved Against A %s/min Limit' % (
+            stats['requests'], failures, elapsed, stats['achieved'], stats['limit']
+        ))
+        return stats
 
 
 if __name__ == '__main__':
     pending = FetchData.create()
     FetchData.send(pending)
-    Deduplicate.prices()
+    FetchData.rollup()
+    FetchData.compute()
+
+    # Prices and technical indicator points are upserted against unique
+    # constraints (refetched or recomputed points overwrite the stored value),
+    # so only the legacy JSON technical values can still hold duplicates:
     Deduplicate.technicals()
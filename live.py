@@ -0,0 +1,232 @@
+import sys
+import time
+import heapq
+import threading
+import traceback
+from multiprocessing.pool import ThreadPool
+from utils import TiingoClient, LiveBuffer, Metrics
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+
+class LiveEngine(object):
+    def __init__(self, symbols, lookback=30, buffer=0.0, workers=8, retry=0.5, maxtries=5, callback=None, token=None):
+        ''' Streams LivePoints for a whole watchlist. Every symbol is polled
+            on each minute mark (plus `buffer` seconds) from a pool of
+            `workers` threads, and each point is delivered as soon as its
+            symbol is ready: put on the `points` queue, and passed to
+            callback(symbol, point) if given. A symbol whose newest bar isn't
+            in yet is retried on its own after `retry`, 2 * `retry`, ...
+            seconds, up to `maxtries` polls, without holding up the others
+        '''
+        self.symbols = list(symbols)
+        self.lookback = lookback
+        self.buffer = buffer
+        self.workers = workers
+        self.retry = retry
+        self.maxtries = maxtries
+        self.callback = callback
+
+        self.client = TiingoClient(token or self._apikey(), workers=workers)
+        self.buffers = dict((symbol, LiveBuffer(symbol, lookback=lookback)) for symbol in self.symbols)
+        self.points = Queue()
+        self.metrics = Metrics.shared()
+
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _apikey(self):
+        '''
+        '''
+        try:
+            from api_key import TIINGO
+            return TIINGO
+        except ImportError:
+            raise Exception('No Tiingo API Key Provided')
+
+    def _nextmark(self, now=None):
+        ''' Epoch time of the next minute mark, plus the buffer
+        '''
+        now = time.time() if now is None else now
+        return (int(now // 60) + 1) * 60 + self.buffer
+
+    def _fetch(self, symbol, after):
+        ''' Worker thread task: only the HTTP round trip and CSV parsing, the
+            buffers are left to the scheduler thread
+        '''
+        start = time.time()
+        try:
+            return self.client.getbars(symbol, after=after), None, time.time() - start
+        except Exception:
+            return None, traceback.format_exc(), time.time() - start
+
+    def _report(self, message, details=None):
+        ''' Report a poll failure or shortfall, with an optional traceback
+        '''
+        print(message)
+        if details:
+            print(details)
+
+    def _deliver(self, symbol, point, mark):
+        self.metrics.observe('live_point_seconds', time.time() - mark, labels={'symbol': symbol})
+        self.metrics.observe('live_point_lag_seconds', point.timesince, labels={'symbol': symbol})
+        self.points.put((symbol, point))
+        if self.callback is not None:
+            try:
+                self.callback(symbol, point)
+            except Exception:
+                self._report('Exception In Live Point Callback For %s:' % symbol, traceback.format_exc())
+
+    def _handle(self, symbol, attempt, mark, bars, error, latency, schedule):
+        ''' Process one poll result on the scheduler thread: deliver the new
+            point, or schedule a retry or the next minute's poll
+        '''
+        buffer = self.buffers[symbol]
+        self.metrics.observe('symbol_fetch_seconds', latency, labels={'api': 'tiingo'})
+
+        point = None
+        if error:
+            self._report('Failed To Fetch %s (Attempt %s):' % (symbol, attempt), error)
+        else:
+            added = buffer.extend(bars)
+            if added and buffer.stale:
+                # Drop the forward-filled bar, so that it gets fetched again:
+                buffer.pop()
+            elif added and not buffer.ready:
+                self._report('Only %s Of %s Lookback Bars Available For %s' % (buffer.count, self.lookback, symbol))
+                schedule(self._nextmark(), symbol, 1, self._nextmark())
+                return
+            elif added:
+                point = buffer.point()
+
+        if point is not None:
+            self._deliver(symbol, point, mark)
+        elif attempt < self.maxtries:
+            self.metrics.increment('live_retries_total', labels={'symbol': symbol})
+            schedule(time.time() + self.retry * 2 ** (attempt - 1), symbol, attempt + 1, mark)
+            return
+        else:
+            self.metrics.increment('live_misses_total', labels={'symbol': symbol})
+            self._report('Warning: No Live Data For %s After %s Tries' % (symbol, attempt))
+        schedule(self._nextmark(), symbol, 1, self._nextmark())
+
+    def run(self):
+        ''' Poll until stopped, on the calling thread
+        '''
+        pool = ThreadPool(min(self.workers, len(self.symbols)) or 1)
+        results = Queue()
+
+        # Heap of (due time, symbol, attempt, minute mark) polls:
+        due = []
+
+        def schedule(at, symbol, attempt, mark):
+            heapq.heappush(due, (at, symbol, attempt, mark))
+
+        mark = self._nextmark()
+        for symbol in self.symbols:
+            schedule(mark, symbol, 1, mark)
+
+        try:
+            while not self._stopped.is_set():
+                # Submit every poll that is due:
+                now = time.time()
+                while due and due[0][0] <= now:
+                    at, symbol, attempt, mark = heapq.heappop(due)
+                    after = self.buffers[symbol].last
+                    pool.apply_async(
+                        self._fetch, (symbol, after),
+                        callback=lambda outcome, symbol=symbol, attempt=attempt, mark=mark: results.put((symbol, attempt, mark) + outcome)
+                    )
+
+                # Handle results as they arrive, until the next poll is due:
+                wait = max(due[0][0] - time.time(), 0.) if due else 1.
+                try:
+                    outcome = results.get(timeout=min(wait, 1.))
+                except Empty:
+                    continue
+                self._handle(*outcome, schedule=schedule)
+        finally:
+            pool.close()
+            pool.join()
+
+    def start(self):
+        ''' Poll in a background thread
+        '''
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stream(self):
+        ''' Generator of (symbol, LivePoint) pairs as they become ready,
+            polling in the background
+        '''
+        if self._thread is None:
+            self.start()
+        try:
+            while True:
+                try:
+                    yield self.points.get(timeout=1.)
+                except Empty:
+                    continue
+        finally:
+            self.stop()
+
+    def __repr__(self):
+        return '<LiveEngine %s Symbols, Lookback %s>' % (len(self.symbols), self.lookback)
+
+
+def checkretry():
+    ''' Drive a LiveEngine's result handling through a stale (forward-filled)
+        bar and its retry, without the network, and check that the point
+        delivered matches one built from the real bars alone
+    '''
+    import numpy as np
+    import pandas as pd
+
+    def bars(closes, start):
+        index = pd.date_range(start, periods=len(closes), freq='min')
+        return pd.DataFrame({
+            'open': closes, 'high': closes, 'low': closes, 'close': closes, 'volume': 100.,
+        }, index=index)
+
+    engine = LiveEngine(['TEST'], lookback=5, token='check')
+    scheduled = []
+    schedule = lambda at, symbol, attempt, mark: scheduled.append((symbol, attempt, mark))
+    mark = time.time()
+
+    # The newest bar repeats the previous close, so it's dropped and retried:
+    closes = list(100. + np.arange(9))
+    engine._handle('TEST', 1, mark, bars(closes + [closes[-1]], '2019-01-02 09:30'), None, 0., schedule)
+    assert engine.points.empty() and scheduled == [('TEST', 2, mark)], 'The Stale Bar Was Not Retried'
+
+    # The retry returns the bar after the last one kept, now filled in:
+    engine._handle('TEST', 2, mark, bars([110.], '2019-01-02 09:39'), None, 0., schedule)
+    symbol, point = engine.points.get_nowait()
+
+    expected = LiveBuffer('TEST', lookback=5)
+    expected.extend(bars(closes + [110.], '2019-01-02 09:30'))
+    assert np.allclose(point.inputs, expected.point().inputs, equal_nan=True), 'The Retried Point Is Wrong'
+    engine.client.http.close()
+    print('Stale Bar Retry OK')
+
+
+if __name__ == '__main__':
+    # Stream a watchlist, or check retry handling offline with:
+    #   python live.py check
+    if sys.argv[1:] == ['check']:
+        checkretry()
+    else:
+        engine = LiveEngine(['SPY', 'QQQ', 'AAPL', 'MSFT', 'AMZN'])
+        for symbol, point in engine.stream():
+            print('%s %s (%.2fs Behind)' % (symbol, point.timestamp, point.timesince))
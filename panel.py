@@ -0,0 +1,110 @@
+import time
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool, cpu_count
+from db.models import *
+from db.pricecache import PriceCache
+from utils import Splits, Features
+
+# Set pandas dataframe column widths:
+pd.set_option('display.expand_frame_repr', False)
+pd.set_option('display.max_columns', 25)
+
+
+def _buildfeatures(item):
+    ''' Process pool task: raw prices for one symbol to its feature dataframe
+    '''
+    symbol, prices, lookback, forecast = item
+    returns = Tradable.toreturns(Tradable._splittimes(prices))
+    return symbol, Features.build(returns, lookback, forecast=forecast)
+
+
+class PanelData(object):
+    def __init__(self, symbols, lookback=30, forecast=15, workers=None, batch=20):
+        ''' Multi-Symbol Dataset, stacked into one frame keyed by symbol. Prices
+            are loaded `batch` symbols per query, and features are built in a
+            pool of `workers` processes
+        '''
+        self.symbols = symbols
+        self.lookback = lookback
+        self.forecast = forecast
+        self.workers = workers or cpu_count()
+        self.batch = batch
+
+        tradables = session.query(Tradable).filter(Tradable.name.in_(symbols)).all()
+        found = set(tradable.name for tradable in tradables)
+        missing = [symbol for symbol in symbols if symbol not in found]
+        if missing:
+            print('Warning: No Tradables Found For %s' % ', '.join(missing))
+        order = dict((symbol, i) for i, symbol in enumerate(symbols))
+        self.tradables = sorted(tradables, key=lambda tradable: order[tradable.name])
+
+        # Download the dataset:
+        self.returns = self._loadreturns()
+        self.features = list(self.returns.columns[:-1])
+
+        # Split Returns Dataset into X/Y Inputs/Outputs:
+        inputs = np.array(self.returns[self.returns.columns[:-1]].reset_index(drop=True))
+        outputs = np.array(self.returns['forecast'].reset_index(drop=True))
+        self.split = Splits(inputs, outputs, self.features, split=0.65)
+
+    @property
+    def train(self):
+        ''' Alias For Training Dataset
+        '''
+        return self.split.train
+
+    @property
+    def test(self):
+        ''' Alias For Testing Dataset
+        '''
+        return self.split.test
+
+    def shuffle(self, split=None):
+        ''' Alias For DataSet Shuffling Functionality
+        '''
+        self.split.shuffle(split=split)
+
+    def _loadprices(self):
+        ''' Load raw prices for all symbols, one query per batch of symbols
+        '''
+        cache = PriceCache.shared()
+        prices = {}
+        for i in range(0, len(self.tradables), self.batch):
+            prices.update(cache.loadmany(self.tradables[i:i + self.batch]))
+        return prices
+
+    def _loadreturns(self):
+        ''' Load in Formatted Lookback/Forecasted Returns Data For All Symbols
+        '''
+        prices = self._loadprices()
+
+        start = time.time()
+        items = [
+            (tradable.name, prices[tradable.name], self.lookback, self.forecast)
+            for tradable in self.tradables
+        ]
+        pool = Pool(processes=self.workers)
+        try:
+            frames = dict(pool.map(_buildfeatures, items))
+        finally:
+            pool.close()
+            pool.join()
+        print('Built Features For %s Symbols In %.2fs (%s Workers)' % (len(items), time.time() - start, self.workers))
+
+        # Stack into a single dataset keyed by symbol:
+        symbols = [tradable.name for tradable in self.tradables]
+        return pd.concat([frames[symbol] for symbol in symbols], keys=symbols, names=['symbol', 'time'])
+
+    def symbol(self, symbol):
+        ''' Feature rows for a single symbol
+        '''
+        return self.returns.xs(symbol, level='symbol')
+
+
+if __name__ == '__main__':
+    symbols = [tradable.name for tradable in session.query(Tradable).all()]
+    data = PanelData(symbols)
+    print(data.returns.groupby(level='symbol').size())
+    print(data.train)
+    print(data.test)
@@ -1,3 +1,10 @@
 from livepoint import LivePoint
 from splits import Splits
 from tiingo import TiingoClient
+from ratelimit import TokenBucket
+from indicators import IndicatorEngine
+from features import Features
+from livebuffer import LiveBuffer
+from store import DataStore
+from metrics import Metrics
+from archive import ResponseArchive
@@ -0,0 +1,184 @@
+import os
+import gzip
+import json
+import hashlib
+import datetime
+import requests
+from metrics import Metrics
+
+try:
+    from urlparse import urlsplit, urlunsplit, parse_qsl
+    from urllib import urlencode
+except ImportError:
+    from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters holding credentials, which are never archived:
+SECRETS = ('apikey', 'token')
+
+# Query parameters left out of the archive key, so that requests differing only
+# in them share their archived responses. Tiingo's IEX bars are requested with
+# startDate=<today> (or the day of the last bar held), and are keyed on symbol
+# and endpoint alone, so that the newest archived response replays on any day;
+# use latest(url, asof=...) to pick an older one:
+UNKEYED = ('startdate',)
+
+# Keys of the (short) JSON bodies AlphaVantage answers throttled or failed
+# requests with, with a 200 status. These are never archived or replayed:
+ERRORS = ('Information', 'Error Message', 'Note')
+
+
+class ResponseArchive(object):
+    _shared = None
+
+    def __init__(self, path=None, replay=False, timeout=30.):
+        ''' Compressed on-disk archive of raw API responses, keyed by URL (with
+            any API key and UNKEYED parameters stripped) and fetch time. Responses are stored under
+            a directory per URL as <fetch time>-<content hash>.json.gz. When
+            recording, every live response is archived; when replaying, the
+            newest archived response is served instead, with no network
+            access. Without a path, responses are fetched and not archived.
+            Live requests give up after `timeout` seconds without a response
+        '''
+        self.path = path
+        self.replay = replay
+        self.timeout = timeout
+
+    @classmethod
+    def shared(cls):
+        ''' Process-wide archive, configured through FINCORE_ARCHIVE (the
+            archive directory), FINCORE_REPLAY=1 and FINCORE_HTTP_TIMEOUT (in
+            seconds, 30 by default)
+        '''
+        if cls._shared is None:
+            path = os.environ.get('FINCORE_ARCHIVE')
+            replay = os.environ.get('FINCORE_REPLAY') == '1'
+            if replay and not path:
+                raise Exception('FINCORE_REPLAY Requires An Archive Path In FINCORE_ARCHIVE')
+            timeout = float(os.environ.get('FINCORE_HTTP_TIMEOUT', 30.))
+            cls._shared = cls(path, replay=replay, timeout=timeout)
+        return cls._shared
+
+    @classmethod
+    def canonical(cls, url):
+        ''' The url with credentials removed and query parameters sorted
+        '''
+        parts = urlsplit(url)
+        query = sorted(
+            (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if key.lower() not in SECRETS
+        )
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+    @classmethod
+    def key(cls, url):
+        ''' The canonical url without its UNKEYED query parameters
+        '''
+        parts = urlsplit(cls.canonical(url))
+        query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key.lower() not in UNKEYED]
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+    @classmethod
+    def failed(cls, body):
+        ''' Whether a response body is an API error or throttling notice
+            rather than data. Only short JSON objects are parsed to check
+        '''
+        if len(body) > 4096 or not body.lstrip().startswith('{'):
+            return False
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return False
+        return isinstance(payload, dict) and any(key in payload for key in ERRORS)
+
+    def directory(self, url):
+        key = hashlib.sha1(self.key(url).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, key[:2], key)
+
+    def entries(self, url):
+        ''' Archived response files for the url, oldest first
+        '''
+        directory = self.directory(url)
+        if not os.path.isdir(directory):
+            return []
+        return [
+            os.path.join(directory, filename)
+            for filename in sorted(os.listdir(directory))
+            if filename.endswith('.json.gz')
+        ]
+
+    def put(self, url, body, fetched=None, status=200):
+        ''' Archive a response body (text) for the url, returning its path.
+            Also used to seed the archive with fixtures for offline runs
+        '''
+        fetched = fetched or datetime.datetime.now()
+        data = body.encode('utf-8')
+        digest = hashlib.sha1(data).hexdigest()[:16]
+
+        directory = self.directory(url)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Created by another thread in the meantime:
+                if not os.path.isdir(directory):
+                    raise
+
+        filepath = os.path.join(directory, '%s-%s.json.gz' % (fetched.strftime('%Y%m%dT%H%M%S%f'), digest))
+        envelope = json.dumps({
+            'url': self.canonical(url),
+            'fetched': fetched.isoformat(),
+            'status': status,
+            'sha1': digest,
+            'body': body,
+        })
+        tmppath = '%s.tmp' % filepath
+        with gzip.open(tmppath, 'wb') as f:
+            f.write(envelope.encode('utf-8'))
+        os.rename(tmppath, filepath)
+        return filepath
+
+    def read(self, filepath):
+        ''' Read an archived response envelope
+        '''
+        with gzip.open(filepath, 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))
+
+    def latest(self, url, asof=None):
+        ''' The newest archived envelope for the url, optionally fetched at or
+            before the given datetime, or None. Error payloads archived before
+            they were filtered out are skipped
+        '''
+        entries = self.entries(url)
+        if asof is not None:
+            cutoff = asof.strftime('%Y%m%dT%H%M%S%f')
+            entries = [entry for entry in entries if os.path.basename(entry)[:len(cutoff)] <= cutoff]
+        for entry in reversed(entries):
+            envelope = self.read(entry)
+            if not self.failed(envelope['body']):
+                return envelope
+        return None
+
+    def get(self, url, headers=None, api=None, session=None):
+        ''' The response body (text) for the url: replayed from the archive
+            in replay mode, otherwise fetched (through the given pooled
+            requests.Session, if any), and archived if recording. Error
+            payloads are returned, but not archived
+        '''
+        metrics = Metrics.shared()
+        labels = {'api': api} if api else None
+        if self.replay:
+            envelope = self.latest(url)
+            if envelope is None:
+                raise Exception('No Archived Response For %s' % self.canonical(url))
+            metrics.increment('archive_replays_total', labels=labels)
+            return envelope['body']
+
+        with metrics.timer('http_request_seconds', labels=labels):
+            response = (session or requests).get(url, headers=headers, timeout=self.timeout)
+        if self.path and response.status_code == 200 and not self.failed(response.text):
+            self.put(url, response.text, status=response.status_code)
+            metrics.increment('archive_writes_total', labels=labels)
+        return response.text
+
+    def __repr__(self):
+        return '<ResponseArchive %s%s>' % (self.path, ' (Replay)' if self.replay else '')
@@ -0,0 +1,162 @@
+import time
+import datetime
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import as_strided
+from metrics import Metrics
+
+
+class Features(object):
+    ''' Vectorized feature construction shared by XYData and LiveXYData
+    '''
+
+    @classmethod
+    def columns(cls, lookback):
+        ''' Feature column names, in the order build() produces them
+        '''
+        columns = ['open', 'high', 'low', 'close', 'volume', 'weekday', 'hour', 'minute', 'range']
+        return columns + ['change.%s' % periods for periods in range(2, lookback)]
+
+    @classmethod
+    def calendar(cls, index):
+        ''' Weekday, hour and minute columns from a DatetimeIndex
+        '''
+        return [
+            ('weekday', np.asarray(index.weekday)),
+            ('hour', np.asarray(index.hour)),
+            ('minute', np.asarray(index.minute)),
+        ]
+
+    @classmethod
+    def changes(cls, prices, lookback):
+        ''' Percent changes over every lag in range(2, lookback), as one
+            (n, lookback - 2) array computed from a single strided window view
+            over the price series. Matches Series.pct_change(periods=lag)
+        '''
+        prices = np.asarray(prices, dtype='float64')
+        if lookback < 3:
+            return np.empty((len(prices), 0))
+
+        # Row t of the window view holds prices[t - lookback + 1 ... t]:
+        padded = np.concatenate([np.full(lookback - 1, np.nan), prices])
+        stride = padded.strides[0]
+        windows = as_strided(padded, shape=(len(prices), lookback), strides=(stride, stride), writeable=False)
+
+        lags = np.arange(2, lookback)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return windows[:, -1:] / windows[:, lookback - 1 - lags] - 1.
+
+    @classmethod
+    def build(cls, returns, lookback, forecast=None, intraday=True):
+        ''' Build the lookback feature dataframe from a returns dataframe (as
+            returned by Tradable.getreturns or TiingoClient.getlive). With a
+            forecast, the predictive 'forecast' column is added as well. For
+            intraday bars, lookback and forecast windows that cross a day
+            boundary are dropped; pass intraday=False for daily bars
+        '''
+        with Metrics.shared().timer('feature_build_seconds'):
+            return cls._build(returns, lookback, forecast=forecast, intraday=intraday)
+
+    @classmethod
+    def _build(cls, returns, lookback, forecast=None, intraday=True):
+        index = returns.index
+        prices = returns.price.values.astype('float64')
+
+        features = returns[['open', 'high', 'low', 'close', 'volume']].copy()
+
+        # Add weekday, hour, minute dataset columns:
+        for key, values in cls.calendar(index):
+            features[key] = values
+
+        # Add in the high/low range
+        features['range'] = returns.high - returns.low
+
+        # Add in the percent change with all n-period lags based on the
+        # lookback parameter:
+        lags = ['change.%s' % periods for periods in range(2, lookback)]
+        changes = pd.DataFrame(cls.changes(prices, lookback), index=index, columns=lags)
+        features = pd.concat([features, changes], axis=1)
+
+        # MARK: If more informative columns are to be added, this is the place
+        # where that should be done:
+        # ...
+        # ..
+
+        # Drop the first N periods in the day based on our allowed lookback window:
+        days = np.asarray(index.normalize())
+        keep = np.ones(len(days), dtype=bool)
+        if intraday:
+            keep[lookback:] = ~(days[lookback:] > days[:-lookback])
+        features = features[keep]
+        prices = prices[keep]
+        days = days[keep]
+
+        if forecast is not None:
+            # Add in the predictive variable:
+            future = np.full(len(prices), np.nan)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                future[:len(prices) - forecast] = prices[forecast:] / prices[:len(prices) - forecast] - 1.
+            features['forecast'] = future
+
+            # Drop the last N periods in the day based on our prediction window:
+            if intraday:
+                keep = np.ones(len(days), dtype=bool)
+                keep[:len(days) - forecast] = ~(days[:len(days) - forecast] < days[forecast:])
+                features = features[keep]
+
+        # Drop NaN values that should apear at head & tail of dataframe:
+        return features.dropna()
+
+
+if __name__ == '__main__':
+    # Parity check against the previous per-row implementation, and a
+    # benchmark on a few million synthetic minute rows:
+    def legacy(returns, lookback, forecast):
+        returns = returns.copy()
+        mappers = [
+            ('weekday', lambda row: row.date.weekday()),
+            ('hour', lambda row: row.time.hour),
+            ('minute', lambda row: row.time.minute),
+        ]
+        for key, mapper in mappers:
+            returns[key] = returns.apply(mapper, axis=1)
+        returns['range'] = returns.high - returns.low
+        for periods in range(2, lookback):
+            returns['change.%s' % periods] = returns.price.pct_change(periods=periods)
+        zerodays = datetime.timedelta(days=0)
+        daydiffs = returns.date.diff(periods=lookback)
+        returns = returns[~(daydiffs > zerodays)]
+        returns['forecast'] = returns.price.pct_change(periods=forecast).shift(periods=-forecast)
+        daydiffs = returns.date.diff(periods=-forecast)
+        returns = returns[~(daydiffs < zerodays)]
+        returns.dropna(inplace=True)
+        return returns.drop(['price', 'date', 'time'], axis=1)
+
+    def synthetic(days):
+        sessions = pd.bdate_range('2015-01-02', periods=days)
+        minutes = pd.timedelta_range('9:30:00', periods=390, freq='min')
+        index = pd.DatetimeIndex((sessions.values[:, None] + minutes.values[None, :]).ravel())
+        price = 100. * np.exp(np.cumsum(np.random.normal(0., 1e-4, len(index))))
+        returns = pd.DataFrame(index=index)
+        for column in ['open', 'high', 'low', 'close']:
+            returns[column] = np.random.normal(0., 0.05, len(index))
+        returns['time'] = index.time
+        returns['date'] = index.date
+        returns['volume'] = np.random.randint(100, 10000, len(index))
+        returns['price'] = price
+        return returns
+
+    returns = synthetic(days=20)
+    expected = legacy(returns, 30, 15)
+    actual = Features.build(returns, 30, forecast=15)
+    assert list(actual.columns) == list(expected.columns)
+    assert (actual.index == expected.index).all()
+    assert np.allclose(actual.values.astype('float64'), expected.values.astype('float64'), rtol=0., atol=1e-12)
+    print('Parity OK: %s Rows x %s Features' % actual.shape)
+
+    returns = synthetic(days=252 * 12)
+    start = time.time()
+    actual = Features.build(returns, 30, forecast=15)
+    print('Built %s x %s Features From %s Rows In %.2fs' % (
+        actual.shape[0], actual.shape[1], len(returns), time.time() - start
+    ))
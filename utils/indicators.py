@@ -0,0 +1,317 @@
+import json
+import time
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from numpy.lib.stride_tricks import as_strided
+
+
+def _windows(values, size):
+    ''' Read-only (n - size + 1, size) sliding window view over a 1-D array
+    '''
+    stride = values.strides[0]
+    count = max(len(values) - size + 1, 0)
+    return as_strided(values, shape=(count, size), strides=(stride, stride), writeable=False)
+
+
+def _offset(values):
+    ''' Index of the first finite value, so leading NaNs can be skipped
+    '''
+    finite = np.flatnonzero(np.isfinite(values))
+    return finite[0] if len(finite) else len(values)
+
+
+def _sma(values, periods):
+    ''' Simple moving averages for all periods at once, as an (n, periods)
+        array, from a single cumulative sum
+    '''
+    values = np.asarray(values, dtype='float64')
+    out = np.full((len(values), len(periods)), np.nan)
+    offset = _offset(values)
+    tail = values[offset:]
+
+    periods = np.asarray(periods)
+    csum = np.concatenate([[0.], np.cumsum(tail)])
+    end = np.arange(1, len(tail) + 1)[:, None]
+    start = end - periods[None, :]
+    averages = (csum[end] - csum[np.maximum(start, 0)]) / periods
+    averages[start < 0] = np.nan
+    out[offset:] = averages
+    return out
+
+
+def _smooth(values, periods, alphas):
+    ''' Exponential smoothing for each period, seeded with the simple moving
+        average of the first `period` values (as TA-Lib and AlphaVantage do)
+    '''
+    values = np.asarray(values, dtype='float64')
+    out = np.full((len(values), len(periods)), np.nan)
+    offset = _offset(values)
+    seeds = _sma(values, periods)
+    for j, (period, alpha) in enumerate(zip(periods, alphas)):
+        first = offset + period - 1
+        if first >= len(values):
+            continue
+        seeded = values.copy()
+        seeded[:first] = np.nan
+        seeded[first] = seeds[first, j]
+        out[:, j] = pd.Series(seeded).ewm(alpha=alpha, adjust=False).mean().values
+    return out
+
+
+def _ema(values, periods):
+    return _smooth(values, periods, [2. / (period + 1) for period in periods])
+
+
+def _wilder(values, periods):
+    return _smooth(values, periods, [1. / period for period in periods])
+
+
+def _rolling(values, periods, reducer, extra=0):
+    ''' Apply `reducer` across each window of `period + extra` values
+    '''
+    out = np.full((len(values), len(periods)), np.nan)
+    for j, period in enumerate(periods):
+        size = period + extra
+        if len(values) >= size:
+            out[size - 1:, j] = reducer(_windows(values, size), axis=1)
+    return out
+
+
+class IndicatorEngine(object):
+    ''' Vectorized technical indicators computed locally from stored prices.
+        Takes the same argument dicts as TechnicalIndicator.args, and computes
+        every time_period of an indicator in a single pass over the bars
+    '''
+    intervals = {
+        '1min': '1min',
+        '5min': '5min',
+        '15min': '15min',
+        '30min': '30min',
+        '60min': '60min',
+        'daily': 'D',
+        'weekly': 'W-FRI',
+        'monthly': 'M',
+    }
+
+    @classmethod
+    def bars(cls, prices, interval='daily'):
+        ''' Resample a minute price dataframe (as returned by getprices) into
+            OHLCV bars at the given AlphaVantage interval
+        '''
+        prices = prices[['open', 'high', 'low', 'close', 'volume']]
+        bars = prices.resample(cls.intervals[interval]).agg(OrderedDict([
+            ('open', 'first'),
+            ('high', 'max'),
+            ('low', 'min'),
+            ('close', 'last'),
+            ('volume', 'sum'),
+        ]))
+        bars = bars.dropna(subset=['close'])
+        if interval == 'daily':
+            bars.index = bars.index.date
+        return bars
+
+    @classmethod
+    def compute(cls, prices, indicators, bars=None):
+        ''' Compute the given indicator arg dicts from a minute price dataframe.
+            Returns a dict of interval to bar-indexed dataframes, with one
+            column per indicator field named like Tradable.gettechnicals
+            (e.g. SMA.5.SMA, MACD.MACD_Signal). Already resampled bars can be
+            passed in as a dict of interval to bars
+        '''
+        # Group the args so that all time periods are computed together:
+        groups = OrderedDict()
+        for args in indicators:
+            args = dict(args)
+            period = args.pop('time_period', None)
+            key = json.dumps(args, sort_keys=True)
+            periods = groups.setdefault(key, (args, []))[1]
+            if period not in periods:
+                periods.append(period)
+
+        results = OrderedDict()
+        bars = dict(bars or {})
+        for args, periods in groups.values():
+            interval = args.get('interval', 'daily')
+            if interval not in bars:
+                bars[interval] = cls.bars(prices, interval)
+            function = args['function']
+            fields = getattr(cls, function.lower())(bars[interval], [p for p in periods if p], args)
+            columns = results.setdefault(interval, OrderedDict())
+            for field, values in fields.items():
+                if periods == [None]:
+                    columns['%s.%s' % (function, field)] = values[:, 0]
+                else:
+                    for j, period in enumerate(periods):
+                        columns['%s.%s.%s' % (function, period, field)] = values[:, j]
+
+        return OrderedDict(
+            (interval, pd.DataFrame(columns, index=bars[interval].index))
+            for interval, columns in results.items()
+        )
+
+    @classmethod
+    def _series(cls, bars, args):
+        return bars[args.get('series_type', 'close')].values.astype('float64')
+
+    @classmethod
+    def sma(cls, bars, periods, args):
+        return {'SMA': _sma(cls._series(bars, args), periods)}
+
+    @classmethod
+    def ema(cls, bars, periods, args):
+        return {'EMA': _ema(cls._series(bars, args), periods)}
+
+    @classmethod
+    def rsi(cls, bars, periods, args):
+        values = cls._series(bars, args)
+        changes = np.diff(values, prepend=np.nan) if len(values) else values
+        gains = _wilder(np.where(changes > 0, changes, np.where(np.isnan(changes), np.nan, 0.)), periods)
+        losses = _wilder(np.where(changes < 0, -changes, np.where(np.isnan(changes), np.nan, 0.)), periods)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = 100. - 100. / (1. + gains / losses)
+        rsi[(losses == 0.) & np.isfinite(gains)] = 100.
+        return {'RSI': rsi}
+
+    @classmethod
+    def macd(cls, bars, periods, args):
+        values = cls._series(bars, args)
+        fast = int(args.get('fastperiod', 12))
+        slow = int(args.get('slowperiod', 26))
+        signal = int(args.get('signalperiod', 9))
+        macd = _ema(values, [fast])[:, 0] - _ema(values, [slow])[:, 0]
+        signals = _ema(macd, [signal])[:, 0]
+        return OrderedDict([
+            ('MACD', macd[:, None]),
+            ('MACD_Signal', signals[:, None]),
+            ('MACD_Hist', (macd - signals)[:, None]),
+        ])
+
+    @classmethod
+    def stoch(cls, bars, periods, args):
+        high = bars.high.values.astype('float64')
+        low = bars.low.values.astype('float64')
+        close = bars.close.values.astype('float64')
+        fastk = int(args.get('fastkperiod', 5))
+        slowk = int(args.get('slowkperiod', 3))
+        slowd = int(args.get('slowdperiod', 3))
+
+        highest = _rolling(high, [fastk], np.max)[:, 0]
+        lowest = _rolling(low, [fastk], np.min)[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fast = 100. * (close - lowest) / (highest - lowest)
+        fast[highest == lowest] = 0.
+        slowks = _sma(fast, [slowk])[:, 0]
+        slowds = _sma(slowks, [slowd])[:, 0]
+        return OrderedDict([
+            ('SlowK', slowks[:, None]),
+            ('SlowD', slowds[:, None]),
+        ])
+
+    @classmethod
+    def adx(cls, bars, periods, args):
+        high = bars.high.values.astype('float64')
+        low = bars.low.values.astype('float64')
+        close = bars.close.values.astype('float64')
+        if len(close) < 2:
+            return {'ADX': np.full((len(close), len(periods)), np.nan)}
+
+        # Directional movement and true range, undefined for the first bar:
+        up = np.diff(high, prepend=np.nan)
+        down = -np.diff(low, prepend=np.nan)
+        plusdm = np.where((up > down) & (up > 0), up, 0.)
+        minusdm = np.where((down > up) & (down > 0), down, 0.)
+        previous = np.concatenate([[np.nan], close[:-1]])
+        truerange = np.fmax(high - low, np.fmax(np.abs(high - previous), np.abs(low - previous)))
+        plusdm[0] = minusdm[0] = truerange[0] = np.nan
+
+        ranges = _wilder(truerange, periods)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            plusdi = 100. * _wilder(plusdm, periods) / ranges
+            minusdi = 100. * _wilder(minusdm, periods) / ranges
+            dx = 100. * np.abs(plusdi - minusdi) / (plusdi + minusdi)
+
+        adx = np.full(dx.shape, np.nan)
+        for j, period in enumerate(periods):
+            adx[:, j] = _wilder(dx[:, j], [period])[:, 0]
+        return {'ADX': adx}
+
+    @classmethod
+    def cci(cls, bars, periods, args):
+        typical = ((bars.high + bars.low + bars.close) / 3.).values.astype('float64')
+        cci = np.full((len(typical), len(periods)), np.nan)
+        for j, period in enumerate(periods):
+            if len(typical) < period:
+                continue
+            windows = _windows(typical, period)
+            means = windows.mean(axis=1)
+            deviations = np.abs(windows - means[:, None]).mean(axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cci[period - 1:, j] = (typical[period - 1:] - means) / (0.015 * deviations)
+        return {'CCI': cci}
+
+    @classmethod
+    def aroon(cls, bars, periods, args):
+        high = bars.high.values.astype('float64')
+        low = bars.low.values.astype('float64')
+        periods = np.asarray(periods, dtype='float64')
+
+        # Position of the extreme within each (period + 1)-bar window, where
+        # the last position is the current bar:
+        up = _rolling(high, periods.astype(int), lambda w, axis: w.shape[1] - 1 - np.argmax(w[:, ::-1], axis=axis), extra=1)
+        down = _rolling(low, periods.astype(int), lambda w, axis: w.shape[1] - 1 - np.argmin(w[:, ::-1], axis=axis), extra=1)
+        return OrderedDict([
+            ('Aroon Down', 100. * down / periods),
+            ('Aroon Up', 100. * up / periods),
+        ])
+
+    @classmethod
+    def obv(cls, bars, periods, args):
+        close = bars.close.values.astype('float64')
+        volume = bars.volume.values.astype('float64')
+        if not len(close):
+            return {'OBV': np.empty((0, 1))}
+        signed = np.sign(np.diff(close)) * volume[1:]
+        obv = np.cumsum(np.concatenate([[volume[0]], signed]))
+        return {'OBV': obv[:, None]}
+
+
+if __name__ == '__main__':
+    # Throughput check on three years of a synthetic minute random walk:
+    minutes = pd.date_range('2015-01-01', periods=390 * 252 * 3, freq='min')
+    close = 100. * np.exp(np.cumsum(np.random.normal(0., 1e-4, len(minutes))))
+    prices = pd.DataFrame({
+        'open': close,
+        'high': close * 1.0005,
+        'low': close * 0.9995,
+        'close': close,
+        'volume': np.random.randint(100, 10000, len(minutes)).astype('float64'),
+    }, index=minutes)
+
+    indicators = []
+    for function in ['SMA', 'EMA', 'RSI', 'ADX', 'CCI', 'AROON']:
+        for period in [5, 10, 20, 50]:
+            indicators.append({'function': function, 'interval': 'daily', 'time_period': period, 'series_type': 'close'})
+    for function in ['MACD', 'STOCH', 'OBV']:
+        indicators.append({'function': function, 'interval': 'daily', 'series_type': 'close'})
+
+    # Too few bars for any window should give NaN columns, not errors:
+    for count in [0, 1, 3]:
+        frames = IndicatorEngine.compute(prices.iloc[:0], indicators, bars={'daily': IndicatorEngine.bars(prices.iloc[:count * 390])})
+        assert len(frames['daily']) == count
+        assert frames['daily'].drop('OBV.OBV', axis=1).isnull().all().all()
+    print('Short Histories OK')
+
+    start = time.time()
+    bars = {'daily': IndicatorEngine.bars(prices)}
+    print('Resampled %s Minute Bars In %.2fs' % (len(prices), time.time() - start))
+
+    runs = 100
+    start = time.time()
+    for i in range(runs):
+        frames = IndicatorEngine.compute(prices, indicators, bars=bars)
+    elapsed = time.time() - start
+    print('Computed %s Indicator Columns %s Times In %.2fs (%.0f Symbol-Indicators/s)' % (
+        frames['daily'].shape[1], runs, elapsed, runs * len(indicators) / elapsed
+    ))
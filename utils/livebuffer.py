@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+from livepoint import LivePoint
+from features import Features
+
+
+class LiveBuffer(object):
+    def __init__(self, symbol, lookback=30):
+        ''' Fixed-size ring buffer of a symbol's last `lookback` minute bars for
+            the current day, from which the newest live features are computed
+            in O(lookback) per bar
+        '''
+        self.symbol = symbol
+        self.lookback = lookback
+        self.features = Features.columns(lookback)
+        self._lags = np.arange(2, lookback)
+
+        # Ring storage, with bars written at slot count % lookback:
+        self._times = np.empty(lookback, dtype='datetime64[ns]')
+        self._bars = np.empty((lookback, 5))
+        self.reset()
+
+    def reset(self):
+        ''' Forget all bars, e.g. at the start of a new trading day
+        '''
+        self.count = 0
+        self.last = None
+
+        # The bar the newest push overwrote, if the ring was full, so that
+        # pop() can put it back:
+        self._evicted = None
+
+    def push(self, timestamp, open, high, low, close, volume):
+        ''' Add a new bar, returning False if it isn't newer than the last one
+        '''
+        timestamp = pd.Timestamp(timestamp)
+        if self.last is not None:
+            if timestamp <= self.last:
+                return False
+            if timestamp.date() != self.last.date():
+                self.reset()
+
+        slot = self.count % self.lookback
+        if self.count >= self.lookback:
+            self._evicted = (slot, self._times[slot].copy(), self._bars[slot].copy())
+        else:
+            self._evicted = None
+        self._times[slot] = timestamp.to_datetime64()
+        self._bars[slot] = (open, high, low, close, volume)
+        self.count += 1
+        self.last = timestamp
+        return True
+
+    def extend(self, bars):
+        ''' Add each bar of a raw OHLCV dataframe (as returned by
+            TiingoClient.getbars), returning the number of new bars
+        '''
+        values = bars[['open', 'high', 'low', 'close', 'volume']].values
+        added = 0
+        for timestamp, bar in zip(bars.index, values):
+            added += self.push(timestamp, *bar)
+        return added
+
+    def pop(self):
+        ''' Drop the newest bar, so that it is fetched again. If pushing it
+            overwrote the oldest bar of a full ring, that bar is restored
+        '''
+        if not self.count:
+            return
+        slot = (self.count - 1) % self.lookback
+        if self._evicted is not None and self._evicted[0] == slot:
+            self._times[slot], self._bars[slot] = self._evicted[1], self._evicted[2]
+        self._evicted = None
+        self.count -= 1
+        if self.count:
+            slot = (self.count - 1) % self.lookback
+            self.last = pd.Timestamp(self._times[slot])
+        else:
+            self.last = None
+
+    def ordered(self):
+        ''' Buffered timestamps and bars, oldest first
+        '''
+        count = min(self.count, self.lookback)
+        slots = (self.count - count + np.arange(count)) % self.lookback
+        return self._times[slots], self._bars[slots]
+
+    def _returns(self, bars):
+        ''' Percent open/high/low/close returns of the newest bar against the
+            previous close, zero for the first bar of the day
+        '''
+        if len(bars) < 2:
+            return np.zeros(4)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = (bars[-1, :4] / bars[-2, 3] - 1.) * 100.
+        returns[np.isnan(returns)] = 0.
+        return returns
+
+    @property
+    def ready(self):
+        ''' Whether there are enough bars today for a full set of lag features
+        '''
+        return self.count >= self.lookback
+
+    @property
+    def stale(self):
+        ''' Whether the newest bar is a forward-filled copy of the previous one
+        '''
+        times, bars = self.ordered()
+        return not len(bars) or (self._returns(bars) == 0.).all()
+
+    def point(self):
+        ''' Build the LivePoint for the newest bar
+        '''
+        times, bars = self.ordered()
+        timestamp = pd.Timestamp(times[-1])
+        open, high, low, close = self._returns(bars)
+        volume = bars[-1, 4] if np.isfinite(bars[-1, 4]) else 0.
+
+        prices = bars[:, 3]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            changes = prices[-1] / prices[-1 - self._lags] - 1.
+
+        values = [open, high, low, close, volume, timestamp.weekday(), timestamp.hour, timestamp.minute, high - low]
+        inputs = np.concatenate([values, changes]).reshape((1, len(self.features)))
+        return LivePoint(
+            inputs=inputs,
+            timestamp=timestamp.to_pydatetime(),
+            features=self.features,
+            returns=pd.DataFrame(inputs, index=[timestamp], columns=self.features),
+        )
+
+    def __repr__(self):
+        return '<LiveBuffer %s: %s/%s Bars>' % (self.symbol, min(self.count, self.lookback), self.lookback)
+
+
+if __name__ == '__main__':
+    # A stale bar pushed onto a full ring and popped again must leave the
+    # buffer as if it had never arrived, so its retry gives the same point:
+    def bars(closes, start):
+        index = pd.date_range(start, periods=len(closes), freq='min')
+        return pd.DataFrame({
+            'open': closes, 'high': closes, 'low': closes, 'close': closes, 'volume': 100.,
+        }, index=index)
+
+    closes = 100. + np.arange(10)
+    buffer = LiveBuffer('TEST', lookback=5)
+    buffer.extend(bars(closes, '2019-01-02 09:30'))
+    buffer.extend(bars([closes[-1]], '2019-01-02 09:40'))
+    assert buffer.stale
+    buffer.pop()
+    assert list(buffer.ordered()[1][:, 3]) == list(closes[-5:])
+    buffer.extend(bars([110.], '2019-01-02 09:40'))
+
+    expected = LiveBuffer('TEST', lookback=5)
+    expected.extend(bars(np.append(closes, 110.), '2019-01-02 09:30'))
+    assert np.allclose(buffer.point().inputs, expected.point().inputs, equal_nan=True)
+    print('Stale Bar Pop OK')
@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import atexit
+import bisect
+import threading
+from contextlib import contextmanager
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+# Default histogram buckets, in seconds:
+BUCKETS = (.001, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60.)
+
+
+class Histogram(object):
+    def __init__(self, buckets=BUCKETS):
+        ''' Fixed-bucket histogram: observing a value is a bisect and a couple
+            of additions, so it is cheap enough for the hot paths
+        '''
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        ''' (upper bound, count of observations <= bound) pairs, ending with
+            the '+Inf' bucket, as Prometheus expects
+        '''
+        total = 0
+        pairs = []
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def serialized(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'buckets': [[str(bound), count] for bound, count in self.cumulative()],
+        }
+
+
+class Metrics(object):
+    ''' Thread-safe registry of counters and histograms for the hot paths
+        (HTTP latency, JSON parsing, ingestion, DB reads, feature builds and
+        live points). Metrics are keyed by name and an optional dict of
+        labels, and exported as a JSON file or in the Prometheus text format
+    '''
+    _shared = None
+    _sharedlock = threading.Lock()
+
+    def __init__(self, prefix='fincore'):
+        self.prefix = prefix
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        ''' Process-wide registry. If the FINCORE_METRICS variable names a
+            file, metrics are written to it when the process exits
+        '''
+        with cls._sharedlock:
+            if cls._shared is None:
+                cls._shared = cls()
+                path = os.environ.get('FINCORE_METRICS')
+                if path:
+                    atexit.register(cls._shared.write, path)
+        return cls._shared
+
+    def _key(self, name, labels):
+        return (name, tuple(sorted(labels.items())) if labels else ())
+
+    def increment(self, name, amount=1, labels=None):
+        ''' Add `amount` to a counter
+        '''
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=None, buckets=BUCKETS):
+        ''' Record a value (e.g. a duration in seconds) in a histogram
+        '''
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, labels=None):
+        ''' Time the enclosed block into the `name` histogram, in seconds
+        '''
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, labels=labels)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self.started = time.time()
+
+    def snapshot(self):
+        ''' All metrics as a JSON-serializable dict
+        '''
+        def entry(key, value):
+            name, labels = key
+            return dict(name=name, labels=dict(labels), **value)
+
+        with self._lock:
+            return {
+                'started': self.started,
+                'time': time.time(),
+                'counters': [entry(key, {'value': value}) for key, value in sorted(self.counters.items())],
+                'histograms': [entry(key, histogram.serialized()) for key, histogram in sorted(self.histograms.items())],
+            }
+
+    def write(self, path):
+        ''' Write a snapshot to the given JSON file, atomically
+        '''
+        temp = '%s.tmp' % path
+        with open(temp, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.rename(temp, path)
+
+    def _labels(self, labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('"', '\\"')) for key, value in pairs)
+
+    def prometheus(self):
+        ''' All metrics in the Prometheus text exposition format
+        '''
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, histogram.cumulative(), histogram.sum, histogram.count)
+                for key, histogram in self.histograms.items()
+            )
+
+        typed = set()
+        for (name, labels), value in counters:
+            name = '%s_%s' % (self.prefix, name)
+            if name not in typed:
+                lines.append('# TYPE %s counter' % name)
+                typed.add(name)
+            lines.append('%s%s %s' % (name, self._labels(labels), value))
+
+        for (name, labels), cumulative, total, count in histograms:
+            name = '%s_%s' % (self.prefix, name)
+            if name not in typed:
+                lines.append('# TYPE %s histogram' % name)
+                typed.add(name)
+            for bound, observed in cumulative:
+                lines.append('%s_bucket%s %s' % (name, self._labels(labels, [('le', bound)]), observed))
+            lines.append('%s_sum%s %s' % (name, self._labels(labels), total))
+            lines.append('%s_count%s %s' % (name, self._labels(labels), count))
+
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=9108, host='127.0.0.1'):
+        ''' Serve the Prometheus text format at http://host:port/metrics from
+            a daemon thread, returning the server
+        '''
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = HTTPServer((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        print('Serving Metrics At http://%s:%s/metrics' % (host, port))
+        return server
+
+    def __repr__(self):
+        return '<Metrics %s Counters, %s Histograms>' % (len(self.counters), len(self.histograms))
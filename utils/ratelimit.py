@@ -0,0 +1,42 @@
+import time
+import threading
+
+
+class TokenBucket(object):
+    def __init__(self, rpm, burst=1):
+        ''' Thread-safe token bucket allowing `rpm` acquisitions per minute on
+            average, and up to `burst` acquisitions back-to-back
+        '''
+        self.rpm = float(rpm)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.acquired = 0
+        self._lock = threading.Lock()
+
+    @property
+    def interval(self):
+        ''' Seconds it takes to refill a single token
+        '''
+        return 60. / self.rpm
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) / self.interval)
+        self.updated = now
+
+    def acquire(self):
+        ''' Block until a token is available, then take it
+        '''
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1.:
+                    self.tokens -= 1.
+                    self.acquired += 1
+                    return
+                wait = (1. - self.tokens) * self.interval
+            time.sleep(wait)
+
+    def __repr__(self):
+        return '<TokenBucket %s/min, burst %s>' % (self.rpm, self.burst)
@@ -1,18 +1,21 @@
-import random
-import pandas as pd
+import numpy as np
 
 class Splits(object):
-    def __init__(self, inputs, outputs, features, split=0.65):
-        ''' Data Split Abstraction
+    def __init__(self, inputs, outputs, features, split=0.65, seed=None):
+        ''' Data Split Abstraction. Splits are kept as row indices (or slices)
+            into the shared inputs/outputs, and only materialized on access
         '''
         self._inputs = inputs
         self._outputs = outputs
         self.features = features
         self.split = split
-        self.count, _ = self._inputs.shape
-        self._index = pd.RangeIndex(start=0, stop=self.count)
+        self.count = self._inputs.shape[0]
+        self._random = np.random.RandomState(seed)
         self.shuffle()
 
+    def _dataset(self, name, index):
+        return DataSet(name, self.features, self._inputs, self._outputs, index=index)
+
     def shuffle(self, split=None):
         '''
         '''
@@ -23,24 +26,138 @@ class Splits(object):
         count = int(self.count * self.split)
         print('Splitting: %s/%s Training/Testing Data Points' % (count, self.count - count))
 
-        # Do Random Splitting:
-        trainindex = sorted(random.sample(self._index, count))
-        testindex  = sorted(set(self._index) - set(trainindex))
+        # Do Random Splitting, keeping rows in order within each split:
+        permutation = self._random.permutation(self.count)
+        trainindex = np.sort(permutation[:count])
+        testindex = np.sort(permutation[count:])
 
         # Create Train and Test Splits:
-        self.train = DataSet('train', self.features, self._inputs[trainindex], self._outputs[trainindex])
-        self.test = DataSet('test', self.features, self._inputs[testindex], self._outputs[testindex])
+        self.train = self._dataset('train', trainindex)
+        self.test = self._dataset('test', testindex)
+
+    def timesplit(self, split=None, purge=0):
+        ''' Time-Ordered Splitting: train on the first rows and test on the
+            rest, with `purge` rows dropped in between. Both splits are
+            contiguous views, so nothing is copied
+        '''
+        if split:
+            self.split = split
+
+        count = int(self.count * self.split)
+        print('Splitting: %s/%s Training/Testing Data Points (Time-Ordered)' % (count, self.count - count - purge))
+        self.train = self._dataset('train', slice(0, count))
+        self.test = self._dataset('test', slice(count + purge, self.count))
+
+    def kfold(self, k=5, shuffle=True, purge=0):
+        ''' Generate (train, test) DataSet pairs for k-fold cross validation.
+            Without shuffle, folds are contiguous blocks and `purge` rows on
+            either side of each test block are dropped from training. The
+            test split is then a view, and the training split is kept as the
+            (up to) two blocks around it, served as views through `blocks`
+            and `batches`; only its `inputs` and `outputs` are copied
+        '''
+        order = self._random.permutation(self.count) if shuffle else np.arange(self.count)
+        bounds = np.linspace(0, self.count, k + 1).astype(int)
+        for fold in range(k):
+            start, end = bounds[fold], bounds[fold + 1]
+            if shuffle:
+                testindex = np.sort(order[start:end])
+                trainindex = np.sort(np.concatenate([order[:start], order[end:]]))
+                test = self._dataset('test', testindex)
+            else:
+                blocks = [
+                    block for block in [slice(0, max(start - purge, 0)), slice(min(end + purge, self.count), self.count)]
+                    if block.stop > block.start
+                ]
+                trainindex = tuple(blocks) if len(blocks) > 1 else (blocks or [slice(0, 0)])[0]
+                test = self._dataset('test', slice(start, end))
+            yield self._dataset('train', trainindex), test
+
+    def walkforward(self, k=5, purge=0, window=None):
+        ''' Generate (train, test) DataSet pairs for walk-forward validation:
+            the rows are cut into k + 1 contiguous blocks, and each block after
+            the first is tested on after training on everything before it (or
+            on the last `window` rows before it), less `purge` rows. All
+            splits are contiguous views
+        '''
+        bounds = np.linspace(0, self.count, k + 2).astype(int)
+        for fold in range(1, k + 1):
+            start, end = bounds[fold], bounds[fold + 1]
+            trainend = max(start - purge, 0)
+            trainstart = max(trainend - window, 0) if window else 0
+            yield self._dataset('train', slice(trainstart, trainend)), self._dataset('test', slice(start, end))
 
 
 class DataSet(object):
-    def __init__(self, name, features, inputs, outputs):
-        ''' Single Input/Output DataSet Representation
+    def __init__(self, name, features, inputs, outputs, index=None):
+        ''' Single Input/Output DataSet Representation, over the given rows
+            (an index array, a slice, or a tuple of slices) of the inputs and
+            outputs. Slices are served as views; index arrays and tuples of
+            slices are only gathered on first access
         '''
         self.name = name
-        self.inputs = inputs
-        self.outputs = outputs
         self.features = features
-        self.count, _ = self.inputs.shape
+        self.index = index
+        self._source = (inputs, outputs)
+        self._inputs = None
+        self._outputs = None
+
+        if index is None:
+            self.count = inputs.shape[0]
+        elif isinstance(index, slice):
+            self.count = len(range(*index.indices(inputs.shape[0])))
+        elif isinstance(index, tuple):
+            self.count = sum(len(range(*block.indices(inputs.shape[0]))) for block in index)
+        else:
+            self.count = len(index)
+
+    def _take(self, array):
+        if self.index is None:
+            return array
+        if isinstance(self.index, tuple):
+            # Separate blocks can't share a single view:
+            return np.concatenate([array[block] for block in self.index])
+        return array[self.index]
+
+    @property
+    def inputs(self):
+        if self._inputs is None:
+            self._inputs = self._take(self._source[0])
+        return self._inputs
+
+    @property
+    def outputs(self):
+        if self._outputs is None:
+            self._outputs = self._take(self._source[1])
+        return self._outputs
+
+    @property
+    def blocks(self):
+        ''' The (inputs, outputs) of each contiguous block of this dataset, as
+            views where the rows are slices
+        '''
+        inputs, outputs = self._source
+        if isinstance(self.index, tuple):
+            return [(inputs[block], outputs[block]) for block in self.index]
+        return [(self.inputs, self.outputs)]
+
+    def batches(self, size):
+        ''' Iterate over (inputs, outputs) batches of this dataset, gathering
+            one batch at a time rather than materializing the whole split.
+            Batches don't span the blocks of a tuple of slices
+        '''
+        inputs, outputs = self._source
+        if self.index is None or isinstance(self.index, (slice, tuple)):
+            blocks = self.index if isinstance(self.index, tuple) else [self.index or slice(None)]
+            for block in blocks:
+                start, stop, step = block.indices(inputs.shape[0])
+                for i in range(start, stop, size * step):
+                    batch = slice(i, min(i + size * step, stop), step)
+                    yield inputs[batch], outputs[batch]
+        else:
+            for i in range(0, self.count, size):
+                batch = self.index[i:i + size]
+                yield inputs[batch], outputs[batch]
 
     def __repr__(self):
         '''
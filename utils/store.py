@@ -0,0 +1,64 @@
+import os
+import json
+import numpy as np
+from numpy.lib.format import open_memmap
+
+
+class DataStore(object):
+    def __init__(self, path):
+        ''' On-Disk Dataset: inputs, outputs and row timestamps as .npy files
+            that are opened as memory maps, plus a meta.json file
+        '''
+        self.path = path
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def create(self, rows, features, dtype='float64'):
+        ''' Create empty, writable memory-mapped inputs/outputs/index arrays
+            for `rows` rows, to be filled in chunks
+        '''
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        inputs = open_memmap(self._file('inputs.npy'), mode='w+', dtype=dtype, shape=(rows, features))
+        outputs = open_memmap(self._file('outputs.npy'), mode='w+', dtype=dtype, shape=(rows,))
+        index = open_memmap(self._file('index.npy'), mode='w+', dtype='datetime64[ns]', shape=(rows,))
+        return inputs, outputs, index
+
+    def write(self, frame, target, meta, chunksize=100000):
+        ''' Write a feature dataframe to disk: every column but `target` is an
+            input, and the frame index holds the row timestamps. Rows are
+            copied over in chunks, so no full extra copy is held in memory
+        '''
+        columns = [column for column in frame.columns if column != target]
+        inputs, outputs, index = self.create(len(frame), len(columns))
+        for start in range(0, len(frame), chunksize):
+            chunk = frame.iloc[start:start + chunksize]
+            end = start + len(chunk)
+            inputs[start:end] = chunk[columns].values
+            outputs[start:end] = chunk[target].values
+            index[start:end] = chunk.index.values
+        for array in (inputs, outputs, index):
+            array.flush()
+        del inputs, outputs, index
+
+        meta = dict(meta)
+        meta['features'] = columns
+        meta['rows'] = len(frame)
+        with open(self._file('meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        print('Wrote %s x %s Dataset To %s' % (len(frame), len(columns), self.path))
+
+    def read(self, mmap_mode='r'):
+        ''' Open the stored dataset, returning (inputs, outputs, index, meta)
+            with the arrays memory-mapped rather than read into memory
+        '''
+        with open(self._file('meta.json')) as f:
+            meta = json.load(f)
+        inputs = np.load(self._file('inputs.npy'), mmap_mode=mmap_mode)
+        outputs = np.load(self._file('outputs.npy'), mmap_mode=mmap_mode)
+        index = np.load(self._file('index.npy'), mmap_mode=mmap_mode)
+        return inputs, outputs, index, meta
+
+    def __repr__(self):
+        return '<DataStore %s>' % self.path
@@ -1,52 +1,87 @@
+import time
 import urllib
 import StringIO
-import requests
 import datetime
+import requests
+import traceback
 import pandas as pd
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from requests.adapters import HTTPAdapter
+from metrics import Metrics
+from archive import ResponseArchive
 
 # Set pandas dataframe column widths:
 pd.set_option('display.expand_frame_repr', False)
 pd.set_option('display.max_columns', 25)
 
 class TiingoClient(object):
-    def __init__(self, token):
-        '''
+    def __init__(self, token, workers=8, base='https://api.tiingo.com'):
+        ''' Requests go through one keep-alive session, so connections (and
+            TLS handshakes) are reused between polls. Batch calls fetch up to
+            `workers` symbols at once
         '''
         self._token = token
         self.headers = {'Content-Type': 'application/json'}
+        self.base = base
+        self.workers = workers
 
-    def getlive(self, symbol):
-        ''' Get Live Stock Price Data
+        # Pool up to one connection per worker:
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+
+    def getbars(self, symbol, after=None):
+        ''' Get Today's Raw Minute Bars, optionally only those after the given
+            timestamp. The IEX endpoint only takes a start date, so bars at or
+            before `after` are trimmed here, before any further processing
         '''
         #
-        today = str(datetime.date.today())
+        start = after.date() if after is not None else datetime.date.today()
         params = urllib.urlencode({
-            'startDate': today,
+            'startDate': str(start),
             'resampleFreq': '1min',
             'columns': 'open,high,low,close,volume',
             'forceFill': 'true',
             'token': self._token,
             'format': 'csv'
         })
-        url = 'https://api.tiingo.com/iex/%s/prices?%s' % (symbol.lower(), params)
+        url = '%s/iex/%s/prices?%s' % (self.base, symbol.lower(), params)
 
         # Do API Query:
-        response = requests.get(url, headers=self.headers)
+        body = ResponseArchive.shared().get(url, headers=self.headers, api='tiingo', session=self.http)
 
         # Convert the CSV-formatted response into a pandas dataframe:
-        prices = pd.read_csv(StringIO.StringIO(response.text))
-        prices['timestamp'] = prices.date.map(lambda x: datetime.datetime.strptime(x[:-7], '%Y-%m-%d %H:%M:%S'))
+        with Metrics.shared().timer('csv_parse_seconds', labels={'api': 'tiingo'}):
+            prices = pd.read_csv(StringIO.StringIO(body))
+        prices['timestamp'] = pd.to_datetime(prices.date.str[:-7], format='%Y-%m-%d %H:%M:%S')
         prices.index = prices.timestamp
         prices.sort_index(inplace=True)
 
         # Filter out future data points:
         now = datetime.datetime.now() + datetime.timedelta(hours=1)
-        infuture = prices.timestamp.map(lambda x: x > now)
+        infuture = prices.timestamp > now
         prices = prices[~infuture]
 
+        # Filter out data points we already have:
+        if after is not None:
+            prices = prices[prices.timestamp > after]
+
+        return prices
+
+    def getlive(self, symbol):
+        ''' Get Live Stock Price Data
+        '''
+        return self.toreturns(self.getbars(symbol))
+
+    @classmethod
+    def toreturns(cls, prices):
+        ''' Convert raw minute bars (as returned by getbars) into returns
+        '''
         # Convert to a returns dataframe:
-        prices['date'] = prices.timestamp.map(lambda x: x.date())
-        prices['time'] = prices.timestamp.map(lambda x: x.time())
+        prices['date'] = prices.timestamp.dt.date
+        prices['time'] = prices.timestamp.dt.time
         prices['price'] = prices.close.copy()
         prices['prev'] = prices.close.shift(1)
         prices['open'] = (prices.open / prices.prev - 1.) * 100.
@@ -59,6 +94,57 @@ class TiingoClient(object):
 
         return returns
 
+    def _many(self, fetch, symbols):
+        ''' Run fetch(symbol) for every symbol on up to `workers` threads.
+            Returns ordered dicts of symbol to result and symbol to latency
+            in seconds; symbols that fail are reported and left out of the
+            results
+        '''
+        def run(symbol):
+            start = time.time()
+            try:
+                return symbol, fetch(symbol), None, time.time() - start
+            except Exception:
+                return symbol, None, traceback.format_exc(), time.time() - start
+
+        symbols = list(symbols)
+        if not symbols:
+            return OrderedDict(), OrderedDict()
+        pool = ThreadPool(min(self.workers, len(symbols)))
+        try:
+            outcomes = pool.map(run, symbols)
+        finally:
+            pool.close()
+            pool.join()
+
+        metrics = Metrics.shared()
+        results, latencies = OrderedDict(), OrderedDict()
+        for symbol, result, error, latency in outcomes:
+            latencies[symbol] = latency
+            metrics.observe('symbol_fetch_seconds', latency, labels={'api': 'tiingo'})
+            if error:
+                metrics.increment('symbol_fetch_failures_total', labels={'api': 'tiingo'})
+                print('Failed To Fetch %s:' % symbol)
+                print(error)
+                continue
+            results[symbol] = result
+        return results, latencies
+
+    def getbars_many(self, symbols, after=None):
+        ''' Get today's raw minute bars for several symbols concurrently,
+            optionally only those after a timestamp (one for all symbols, or
+            a dict of symbol to timestamp). Returns (bars, latencies) dicts
+        '''
+        def fetch(symbol):
+            return self.getbars(symbol, after=after.get(symbol) if isinstance(after, dict) else after)
+        return self._many(fetch, symbols)
+
+    def getlive_many(self, symbols):
+        ''' Get live returns data for several symbols concurrently. Returns
+            (returns, latencies) dicts keyed by symbol
+        '''
+        return self._many(self.getlive, symbols)
+
 
 
 if __name__ == '__main__':
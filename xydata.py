@@ -4,21 +4,31 @@ import traceback
 import pandas as pd
 import numpy as np
 from db.models import *
-from utils import Splits, TiingoClient, LivePoint
+from utils import Splits, TiingoClient, LivePoint, Features, LiveBuffer, DataStore, Metrics
 
 # Set pandas dataframe column widths:
 pd.set_option('display.expand_frame_repr', False)
 pd.set_option('display.max_columns', 25)
 
 class XYData(object):
-    def __init__(self, symbol, lookback=30, forecast=15):
-        '''
+    def __init__(self, symbol, lookback=30, forecast=15, preload=True, interval='1min'):
+        ''' Without `preload`, the full history isn't loaded up front, and
+            the data can instead be streamed with iter_batches. Any other
+            `interval` than 1min (e.g. 15min or daily) is built from the
+            pre-aggregated price rollups, with lookback and forecast counted
+            in bars of that interval
         '''
         self.symbol = symbol
         self.lookback = lookback
         self.forecast = forecast
+        self.interval = interval
 
         self.tradable = session.query(Tradable).filter_by(name=symbol).first()
+        if not preload:
+            self.returns = None
+            self.features = Features.columns(lookback)
+            self.split = None
+            return
 
         # Download the dataset:
         self.returns = self._loadreturns()
@@ -46,62 +56,112 @@ class XYData(object):
         '''
         self.split.shuffle(split=split)
 
+    def iter_batches(self, batch_size=1024, start=None, end=None, chunksize=10000):
+        ''' Stream (inputs, outputs) batches from the database in time order,
+            reading `chunksize` price rows at a time. Enough rows are carried
+            over between chunks to give every row its full lookback context
+            and forecast, so batches match those of a full load. Only 1min
+            bars are streamed
+        '''
+        if self.interval != '1min':
+            raise Exception('Only 1min Bars Can Be Streamed, Not %s' % self.interval)
+
+        carry = None
+        last = None
+        inputs, outputs = [], []
+        buffered = 0
+
+        for chunk in self.tradable.iterprices(start=start, end=end, chunksize=chunksize):
+            window = chunk if carry is None else pd.concat([carry, chunk], ignore_index=True)
+            prices = Tradable._splittimes(window.copy())
+            returns = Features.build(Tradable.toreturns(prices), self.lookback, forecast=self.forecast)
+
+            # Only emit rows we haven't yet, and (once any have been) that have
+            # a full lookback window within this one. Until then the window
+            # starts at the first row, just like a full load:
+            if last is not None:
+                returns = returns[returns.index > last]
+                if len(prices) <= self.lookback:
+                    returns = returns.iloc[:0]
+                else:
+                    returns = returns[returns.index >= prices.index[self.lookback]]
+
+            if len(returns):
+                last = returns.index[-1]
+                inputs.append(returns[returns.columns[:-1]].values)
+                outputs.append(returns['forecast'].values)
+                buffered += len(returns)
+
+            # Carry over the rows that haven't been emitted yet, along with the
+            # lookback rows before them:
+            if last is None:
+                carry = window
+            else:
+                first = np.searchsorted(window.time.values, np.datetime64(last), side='right')
+                carry = window.iloc[max(first - self.lookback, 0):]
+
+            # Yield any full batches:
+            if buffered >= batch_size:
+                inputs, outputs = [np.concatenate(inputs)], [np.concatenate(outputs)]
+                count = buffered - buffered % batch_size
+                for i in range(0, count, batch_size):
+                    yield inputs[0][i:i + batch_size], outputs[0][i:i + batch_size]
+                inputs, outputs = [inputs[0][count:]], [outputs[0][count:]]
+                buffered -= count
+
+        if buffered:
+            yield np.concatenate(inputs), np.concatenate(outputs)
+
+    def export(self, path):
+        ''' Write the feature matrix and targets to memory-mappable files at
+            the given path, to be opened again with XYData.load
+        '''
+        DataStore(path).write(self.returns, 'forecast', meta={
+            'symbol': self.symbol,
+            'lookback': self.lookback,
+            'forecast': self.forecast,
+            'interval': self.interval,
+            'highwater': str(self.returns.index.max()),
+        })
+
+    @classmethod
+    def load(cls, path, split=0.65):
+        ''' Open a dataset written by XYData.export without touching the
+            database. The inputs and outputs stay memory-mapped, so splits
+            read them through the page cache rather than into memory
+        '''
+        inputs, outputs, index, meta = DataStore(path).read()
+
+        data = cls.__new__(cls)
+        data.symbol = meta['symbol']
+        data.lookback = meta['lookback']
+        data.forecast = meta['forecast']
+        data.interval = meta.get('interval', '1min')
+        data.highwater = meta['highwater']
+        data.features = meta['features']
+        data.index = index
+        data.tradable = None
+        data.returns = None
+        data.split = Splits(inputs, outputs, data.features, split=split)
+        return data
+
     def _loadreturns(self):
         ''' Load in Formatted Lookback/Forecasted Returns Data
         '''
-        returns = self.tradable.getreturns()
-
-        # Add weekday, hour, minute dataset columns:
-        mappers = [
-            ('weekday', lambda row: row.date.weekday()),
-            ('hour', lambda row: row.time.hour),
-            ('minute', lambda row: row.time.minute),
-        ]
-        for key, mapper in mappers:
-            returns[key] = returns.apply(mapper, axis=1)
-
-        # Add in the high/low range
-        returns['range'] = returns.high - returns.low
-
-        # Add in the percent change with all n-period lags based on the
-        # self.lookback parameter:
-        for periods in range(2, self.lookback):
-            returns['change.%s' % periods] = returns.price.pct_change(periods=periods)
-
-
-        # MARK: If more informative columns are to be added, this is the place
-        # where that should be done:
-        # ...
-        # ..
-
-
-        # Drop the first N periods in the day based on our allowed lookback window:
-        zerodays = datetime.timedelta(days=0)
-        daydiffs = returns.date.diff(periods=self.lookback)
-        returns = returns[~(daydiffs > zerodays)]
-
-        # Add in the predictive variable:
-        returns['forecast'] = returns.price.pct_change(periods=self.forecast).shift(periods=-self.forecast)
-
-        # Drop the last N periods in the day based on our prediction window:
-        daydiffs = returns.date.diff(periods=-self.forecast)
-        returns = returns[~(daydiffs < zerodays)]
-
-        # Drop NaN values that should apear at head & tail of dataframe:
-        returns.dropna(inplace=True)
-
-        # Drop any non-stationary columns:
-        returns = returns.drop(['price', 'date', 'time'], axis=1)
-
-        return returns
+        returns = self.tradable.getreturns(interval=self.interval)
+        return Features.build(returns, self.lookback, forecast=self.forecast, intraday=self.interval != 'daily')
 
 
 class LiveXYData(object):
-    def __init__(self, symbol, lookback=30):
-        '''
+    def __init__(self, symbol, lookback=30, incremental=True):
+        ''' With `incremental`, only new bars are read in on each poll and the
+            features are updated from a ring buffer of the last `lookback`
+            bars, rather than being rebuilt from the whole day's history
         '''
         self.symbol = symbol
         self.lookback = lookback
+        self.incremental = incremental
+        self.buffer = LiveBuffer(symbol, lookback=lookback)
         self._token = self._apikey()
         self.client = TiingoClient(self._token)
 
@@ -122,7 +182,11 @@ class LiveXYData(object):
             time.sleep(sleeptime)
             try:
                 print('Fetching Live Data...')
-                yield self.getlive()
+                metrics = Metrics.shared()
+                with metrics.timer('live_point_seconds', labels={'symbol': self.symbol}):
+                    point = self.getlive()
+                metrics.observe('live_point_lag_seconds', point.timesince, labels={'symbol': self.symbol})
+                yield point
             except Exception as e:
                 print('An Exception Occurred Getting Live Data Point: "%s" (Skipping...)' % e)
                 print(traceback.format_exc())
@@ -138,11 +202,11 @@ class LiveXYData(object):
     def getlive(self, attempt=1):
         '''
         '''
-        returns = self.client.getlive(self.symbol)
+        point = self._update() if self.incremental else self._rebuild()
 
         # Check to see if we got updated prices for the most recent minute. If
-        # not, we try again, up to three times:
-        if (returns[returns.columns[:4]].iloc[-1] == 0.0).all():
+        # not, we try again, up to five times:
+        if point is None:
             maxtries = 5
             if attempt < maxtries:
                 sleeptime = 2 ** attempt
@@ -153,34 +217,33 @@ class LiveXYData(object):
             else:
                 raise Exception('Failed To Get Current Data After %s Tries' % maxtries)
 
-        # Add weekday, hour, minute dataset columns:
-        mappers = [
-            ('weekday', lambda row: row.date.weekday()),
-            ('hour', lambda row: row.time.hour),
-            ('minute', lambda row: row.time.minute),
-        ]
-        for key, mapper in mappers:
-            returns[key] = returns.apply(mapper, axis=1)
-
-        # Add in the high/low range
-        returns['range'] = returns.high - returns.low
+        return point
 
-        # Add in the percent change with all n-period lags based on the
-        # self.lookback parameter:
-        for periods in range(2, self.lookback):
-            returns['change.%s' % periods] = returns.price.pct_change(periods=periods)
+    def _update(self):
+        ''' Read in only the bars newer than the buffer, and build the newest
+            LivePoint from it. Returns None if the newest bar is stale
+        '''
+        bars = self.client.getbars(self.symbol, after=self.buffer.last)
+        self.buffer.extend(bars)
 
+        if self.buffer.stale:
+            # Drop the forward-filled bar, so that it gets fetched again:
+            self.buffer.pop()
+            return None
+        if not self.buffer.ready:
+            raise Exception('Only %s Of %s Lookback Bars Available' % (self.buffer.count, self.lookback))
 
-        # Drop the first N periods in the day based on our allowed lookback window:
-        zerodays = datetime.timedelta(days=0)
-        daydiffs = returns.date.diff(periods=self.lookback)
-        returns = returns[~(daydiffs > zerodays)]
+        return self.buffer.point()
 
-        # Drop NaN values that should apear at head & tail of dataframe:
-        returns.dropna(inplace=True)
+    def _rebuild(self):
+        ''' Rebuild the features over the whole day's history, and take the
+            newest LivePoint from it. Returns None if the newest bar is stale
+        '''
+        returns = self.client.getlive(self.symbol)
+        if (returns[returns.columns[:4]].iloc[-1] == 0.0).all():
+            return None
 
-        # Drop any non-stationary columns:
-        returns = returns.drop(['price', 'date', 'time'], axis=1)
+        returns = Features.build(returns, self.lookback)
 
         #
         features = list(returns.columns)